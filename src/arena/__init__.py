@@ -0,0 +1,309 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import chess
+import chess.pgn
+
+from ..chess import Board
+from ..llm.budget import TurnBudget
+from ..llm.example import DummyWebsocket
+from ..llm.prompts import TemplateType
+from ..llm.service import ModelProvider, llm_move
+
+
+class RandomPlayer:
+    async def move(self, board: Board) -> dict:
+        board.random_move()
+        return {"source": "random"}
+
+
+class EnginePlayer:
+    def __init__(self, time_limit: float = 0.1):
+        self.time_limit = time_limit
+
+    async def move(self, board: Board) -> dict:
+        await asyncio.to_thread(board.engine_move, self.time_limit)
+        return {"source": "engine"}
+
+
+class LLMPlayer:
+    def __init__(
+        self,
+        model_provider: ModelProvider,
+        model_name: str,
+        template_type: TemplateType,
+    ):
+        self.model_provider = model_provider
+        self.model_name = model_name
+        self.template_type = template_type
+        # both sides of a game can be agents, each keeps its own conversation
+        self.histories: dict[str, list] = {}
+
+    async def move(self, board: Board) -> dict:
+        board.message_history = self.histories.setdefault(board.id, [])
+        report = await llm_move(
+            board,
+            self.model_provider,
+            self.model_name,
+            self.template_type,
+            budget=TurnBudget.from_env(),
+        )
+        return report.model_dump()
+
+
+def parse_player(spec: str, template_type: TemplateType):
+    """Players are given as "random", "engine[:seconds]" or "<provider>:<model>"."""
+    kind, _, argument = spec.partition(":")
+    match kind:
+        case "random":
+            return RandomPlayer()
+        case "engine":
+            return EnginePlayer(float(argument) if argument else 0.1)
+        case _:
+            return LLMPlayer(ModelProvider(kind), argument, template_type)
+
+
+async def play_game(index: int, white: tuple, black: tuple, max_plies: int) -> dict:
+    board = Board(f"arena-{index}", DummyWebsocket())
+    moves = []
+    while board.outcome(claim_draw=True) is None and len(board.move_stack) < max_plies:
+        role, player, _ = white if board.turn == chess.WHITE else black
+        start = time.perf_counter()
+        stats = await player.move(board)
+        moves.append({"player": role, "seconds": time.perf_counter() - start, **stats})
+
+    outcome = board.outcome(claim_draw=True)
+    game = chess.pgn.Game()
+    game.headers["Event"] = "Arena"
+    game.headers["Round"] = str(index + 1)
+    game.headers["White"] = white[2]
+    game.headers["Black"] = black[2]
+    game.headers["Result"] = outcome.result() if outcome else "*"
+    node = game
+    for move in board.move_stack:
+        node = node.add_variation(move)
+    return {
+        "index": index,
+        "white": white[0],
+        "black": black[0],
+        "result": game.headers["Result"],
+        "termination": outcome.termination.name.lower() if outcome else "max_plies",
+        "plies": len(board.move_stack),
+        "moves": moves,
+        "pgn": str(game),
+    }
+
+
+async def run_games(config: dict, indices: list[int], on_game=None) -> list[dict]:
+    template_type = TemplateType[config["template"]]
+    players = {
+        role: (role, parse_player(config[role], template_type), config[role])
+        for role in ("a", "b")
+    }
+    semaphore = asyncio.Semaphore(config["concurrency"])
+
+    async def run(index: int) -> dict:
+        # the players swap colors every game
+        white, black = (
+            (players["a"], players["b"])
+            if index % 2 == 0
+            else (players["b"], players["a"])
+        )
+        async with semaphore:
+            game = await play_game(index, white, black, config["max_plies"])
+        if on_game is not None:
+            on_game(game)
+        return game
+
+    return await asyncio.gather(*map(run, indices))
+
+
+# one event loop per worker process, the models and schedulers the service
+# caches are bound to the loop they were first used on
+_loop: asyncio.AbstractEventLoop | None = None
+
+
+def _init_worker():
+    global _loop
+    _loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_loop)
+
+
+def _run_batch(config: dict, indices: list[int]) -> list[dict]:
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        return _loop.run_until_complete(run_games(config, indices))
+
+
+class GameWriter:
+    """Appends finished games to a PGN and a JSONL file as they come in."""
+
+    def __init__(self, pgn_path: str | None, jsonl_path: str | None):
+        self.pgn = open(pgn_path, "a") if pgn_path else None
+        self.jsonl = open(jsonl_path, "a") if jsonl_path else None
+
+    def write(self, game: dict):
+        if self.pgn:
+            self.pgn.write(game["pgn"] + "\n\n")
+            self.pgn.flush()
+        if self.jsonl:
+            record = {k: v for k, v in game.items() if k != "pgn"}
+            self.jsonl.write(json.dumps(record) + "\n")
+            self.jsonl.flush()
+
+    def close(self):
+        for f in (self.pgn, self.jsonl):
+            if f:
+                f.close()
+
+
+def summarize(config: dict, games: list[dict], elapsed: float) -> dict:
+    moves = defaultdict(list)
+    scores = {role: Counter() for role in ("a", "b")}
+    for game in games:
+        for move in game["moves"]:
+            moves[move["player"]].append(move)
+        points = {"1-0": (1, 0), "0-1": (0, 1), "1/2-1/2": (0.5, 0.5)}
+        white_points, black_points = points.get(game["result"], (0, 0))
+        scores[game["white"]]["points"] += white_points
+        scores[game["black"]]["points"] += black_points
+        scores[game["white"]]["games"] += 1
+        scores[game["black"]]["games"] += 1
+
+    players = {}
+    for role in ("a", "b"):
+        player_moves = moves[role]
+        seconds = sorted(m["seconds"] for m in player_moves)
+        turns = [m for m in player_moves if m["source"] in ("agent", "fallback")]
+        illegal = sum(m.get("illegal_moves", 0) for m in player_moves)
+        # every rejected make_move call and every move the agent made itself
+        attempts = illegal + sum(m["source"] == "agent" for m in player_moves)
+        players[role] = {
+            "player": config[role],
+            "games": scores[role]["games"],
+            "points": scores[role]["points"],
+            "moves": len(player_moves),
+            "mean_rounds": (
+                statistics.fmean(m["rounds"] for m in turns) if turns else None
+            ),
+            "illegal_move_rate": illegal / attempts if attempts else None,
+            "fallback_rate": (
+                sum(m["source"] == "fallback" for m in player_moves) / len(player_moves)
+                if player_moves
+                else None
+            ),
+            "tokens": sum(m.get("tokens", 0) for m in player_moves),
+            "latency_p50": _percentile(seconds, 50),
+            "latency_p90": _percentile(seconds, 90),
+            "latency_p99": _percentile(seconds, 99),
+        }
+    total_moves = sum(len(m) for m in moves.values())
+    return {
+        "games": len(games),
+        "seconds": elapsed,
+        "games_per_minute": len(games) / elapsed * 60 if elapsed else 0,
+        "moves_per_second": total_moves / elapsed if elapsed else 0,
+        "results": dict(Counter(game["result"] for game in games)),
+        "players": players,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Play games without the UI.")
+    parser.add_argument("-a", default="openai:gpt-4o-mini", help="first player")
+    parser.add_argument("-b", default="random", help="second player")
+    parser.add_argument("-n", "--games", type=int, default=10)
+    parser.add_argument(
+        "-c", "--concurrency", type=int, default=8, help="games per process"
+    )
+    parser.add_argument("-p", "--processes", type=int, default=1)
+    parser.add_argument(
+        "--template", default="STATE", choices=[t.name for t in TemplateType]
+    )
+    parser.add_argument("--max-plies", type=int, default=200)
+    parser.add_argument("--pgn", help="append finished games to this PGN file")
+    parser.add_argument("--jsonl", help="append finished games to this JSONL file")
+    parser.add_argument("--report", help="write the summary as JSON")
+    args = parser.parse_args(argv)
+
+    config = {
+        "a": args.a,
+        "b": args.b,
+        "template": args.template,
+        "max_plies": args.max_plies,
+        "concurrency": args.concurrency,
+    }
+    writer = GameWriter(args.pgn, args.jsonl)
+    games = []
+    out = sys.stdout
+
+    def on_game(game: dict):
+        games.append(game)
+        writer.write(game)
+        white, black = config[game["white"]], config[game["black"]]
+        print(
+            f"Game {len(games)}/{args.games}: {white} - {black} {game['result']} "
+            f"({game['termination']}, {game['plies']} plies)",
+            file=out,
+        )
+
+    start = time.perf_counter()
+    try:
+        if args.processes <= 1:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                asyncio.run(run_games(config, list(range(args.games)), on_game))
+        else:
+            indices = list(range(args.games))
+            batches = [
+                indices[i : i + args.concurrency]
+                for i in range(0, len(indices), args.concurrency)
+            ]
+            with ProcessPoolExecutor(
+                args.processes,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            ) as pool:
+                futures = [pool.submit(_run_batch, config, batch) for batch in batches]
+                for future in as_completed(futures):
+                    for game in future.result():
+                        on_game(game)
+    finally:
+        writer.close()
+    report = summarize(config, games, time.perf_counter() - start)
+
+    print(
+        f"{report['games']} games in {report['seconds']:.1f}s "
+        f"({report['games_per_minute']:.1f} games/min, {report['moves_per_second']:.1f} moves/s)"
+    )
+    for role, stats in report["players"].items():
+        print(f"{role}: {stats['player']}")
+        for key, value in stats.items():
+            if key != "player":
+                print(f"  {key:<18} {_format(value)}")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+def _format(value) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.3f}"
+    return str(value)
+
+
+def _percentile(values: list[float], percentile: float) -> float | None:
+    if not values:
+        return None
+    index = min(len(values) - 1, round(percentile / 100 * (len(values) - 1)))
+    return values[index]
@@ -0,0 +1,311 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import sys
+from collections import deque
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterable
+from concurrent.futures import Executor, ProcessPoolExecutor
+
+import chess
+import chess.pgn
+
+from ..chess import Board
+from ..chess.engine import Searcher, format_score
+from ..llm.budget import TurnBudget
+from ..llm.encoding import PositionEncoding
+from ..llm.example import DummyWebsocket
+from ..llm.prompts import TemplateType
+from ..llm.service import ModelProvider, llm_move
+from ..llm.tools import Toolbelt
+
+
+class Position:
+    __slots__ = ("index", "id", "fen", "moves", "error")
+
+    def __init__(
+        self,
+        index: int,
+        id: str | None,
+        fen: str | None,
+        moves: list[str] | None = None,
+        error: str | None = None,
+    ):
+        self.index = index
+        self.id = id
+        self.fen = fen
+        self.moves = moves or []
+        self.error = error
+
+
+class PositionParser:
+    """
+    Turns EPD or PGN text into positions as it is fed line by line, so files of
+    any size are read with bounded memory. A PGN game yields its final position,
+    or every position with all_plies.
+    """
+
+    def __init__(self, format: str = "epd", all_plies: bool = False):
+        if format not in ("epd", "pgn"):
+            raise ValueError(f"Unsupported position format: {format}")
+        self.format = format
+        self.all_plies = all_plies
+        self.count = 0
+        self._game: list[str] = []
+        self._in_movetext = False
+
+    def feed(self, line: str) -> list[Position]:
+        if self.format == "epd":
+            line = line.strip()
+            if not line or line.startswith("#"):
+                return []
+            return [self._parse_epd(line)]
+        # a tag after the movetext starts the next game
+        stripped = line.strip()
+        if stripped.startswith("[") and self._in_movetext:
+            positions = self._parse_game()
+            self._game = [line]
+            return positions
+        if stripped and not stripped.startswith("["):
+            self._in_movetext = True
+        self._game.append(line)
+        return []
+
+    def close(self) -> list[Position]:
+        if self.format == "pgn" and self._in_movetext:
+            return self._parse_game()
+        return []
+
+    def _next(self, id, fen, moves=None, error=None) -> Position:
+        position = Position(self.count, id, fen, moves, error)
+        self.count += 1
+        return position
+
+    def _parse_epd(self, line: str) -> Position:
+        try:
+            board, operations = chess.Board.from_epd(line)
+        except ValueError as e:
+            return self._next(None, None, error=f"Invalid EPD: {e}")
+        id = operations.get("id")
+        return self._next(str(id) if id is not None else None, board.fen())
+
+    def _parse_game(self) -> list[Position]:
+        text = "\n".join(line.rstrip("\n") for line in self._game)
+        self._game = []
+        self._in_movetext = False
+        game = chess.pgn.read_game(io.StringIO(text))
+        if game is None:
+            return []
+        headers = game.headers
+        id = f"{headers.get('White', '?')} - {headers.get('Black', '?')}, {headers.get('Date', '?')}"
+        if game.errors:
+            return [self._next(id, None, error=f"Invalid PGN: {game.errors[0]}")]
+        fen = game.board().fen()
+        moves = [move.uci() for move in game.mainline_moves()]
+        if not self.all_plies:
+            return [self._next(id, fen, moves)]
+        return [self._next(id, fen, moves[:ply]) for ply in range(len(moves) + 1)]
+
+
+def analyse_position(fen: str, moves: list[str], options: dict) -> dict:
+    """Runs the agent's board tools on a position, in a pool worker."""
+    board = _build_board(fen, moves)
+    toolbelt = Toolbelt(board, encoding=PositionEncoding(options["encoding"]))
+    get_square_info = toolbelt["get_square_info"].func
+    analyse_move = toolbelt["analyse_move"].func
+    result = {
+        "fen": board.fen(),
+        "position": toolbelt["get_position"].func(),
+        "squares": {
+            chess.square_name(s): get_square_info(chess.square_name(s))
+            for s in chess.SquareSet(board.occupied)
+        },
+        "moves": {
+            san: analyse_move(san)
+            for san in (board.san(move) for move in board.legal_moves)
+        },
+    }
+    if options.get("engine"):
+        candidates = Searcher(time_limit=options["engine"]).search(board, 5)
+        result["candidates"] = [
+            {"move": board.san(move), "score": format_score(score)}
+            for move, score in candidates
+        ]
+    return result
+
+
+async def analyse_stream(
+    lines: AsyncIterator[str],
+    parser: PositionParser,
+    options: dict,
+    executor: Executor | None = None,
+    offset: int = 0,
+    window: int = 16,
+) -> AsyncIterator[dict]:
+    """
+    Yields one result per position in input order. At most window positions are
+    in flight, and the first offset positions are skipped to resume a run.
+    """
+    loop = asyncio.get_running_loop()
+    pending: deque[asyncio.Future] = deque()
+
+    async def positions():
+        async for line in lines:
+            for position in parser.feed(line):
+                yield position
+        for position in parser.close():
+            yield position
+
+    async for position in positions():
+        if position.index < offset:
+            continue
+        pending.append(
+            asyncio.ensure_future(_analyse(loop, position, options, executor))
+        )
+        if len(pending) >= window:
+            yield await pending.popleft()
+    while pending:
+        yield await pending.popleft()
+
+
+async def _analyse(
+    loop: asyncio.AbstractEventLoop,
+    position: Position,
+    options: dict,
+    executor: Executor | None,
+) -> dict:
+    result = {"index": position.index, "id": position.id}
+    if position.error:
+        return {**result, "error": position.error}
+    try:
+        result.update(
+            await loop.run_in_executor(
+                executor, analyse_position, position.fen, position.moves, options
+            )
+        )
+        if options.get("llm"):
+            result["llm_move"] = await _llm_move(position, options["llm"])
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+
+async def _llm_move(position: Position, player: str) -> dict:
+    provider, _, model_name = player.partition(":")
+    board = _build_board(position.fen, position.moves)
+    board.websocket = DummyWebsocket()
+    if board.is_game_over():
+        return {"move": None}
+    report = await llm_move(
+        board,
+        ModelProvider(provider),
+        model_name,
+        TemplateType.STATE,
+        budget=TurnBudget.from_env(),
+    )
+    return {"move": board.peek().uci(), **report.model_dump()}
+
+
+def _build_board(fen: str, moves: list[str]) -> Board:
+    board = Board("batch")
+    board.set_fen(fen)
+    board.fen0 = fen
+    for move in moves:
+        board.push_uci(move)
+    return board
+
+
+def create_executor(workers: int | None = None) -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Analyse an EPD or PGN file and write NDJSON results."
+    )
+    parser.add_argument("input", help="EPD or PGN file, - for stdin")
+    parser.add_argument("-o", "--output", help="NDJSON file, resumed if it exists")
+    parser.add_argument("--format", choices=["epd", "pgn"])
+    parser.add_argument(
+        "--all-plies", action="store_true", help="analyse every position of a game"
+    )
+    parser.add_argument(
+        "--encoding",
+        default=PositionEncoding.COMPACT.value,
+        choices=[e.value for e in PositionEncoding],
+    )
+    parser.add_argument(
+        "--engine", type=float, default=0, help="engine seconds per position"
+    )
+    parser.add_argument("--llm", help="also ask <provider>:<model> for a move")
+    parser.add_argument("-p", "--processes", type=int, default=os.cpu_count())
+    args = parser.parse_args(argv)
+
+    format = args.format or ("pgn" if args.input.endswith(".pgn") else "epd")
+    options = {"encoding": args.encoding, "engine": args.engine, "llm": args.llm}
+    offset = _resume(args.output) if args.output else 0
+    if offset:
+        print(f"Resuming after {offset} positions", file=sys.stderr)
+    asyncio.run(_run(args, PositionParser(format, args.all_plies), options, offset))
+    return 0
+
+
+async def _run(args, parser: PositionParser, options: dict, offset: int):
+    source = sys.stdin if args.input == "-" else open(args.input)
+    sink = open(args.output, "a") if args.output else sys.stdout
+    try:
+        with (
+            create_executor(args.processes) as executor,
+            open(os.devnull, "w") as devnull,
+            # the agent logs every call, stdout is kept for the results
+            contextlib.redirect_stdout(devnull),
+        ):
+            results = analyse_stream(
+                _lines(source),
+                parser,
+                options,
+                executor,
+                offset,
+                window=2 * (args.processes or 1),
+            )
+            async for result in results:
+                sink.write(json.dumps(result) + "\n")
+                sink.flush()
+                if args.output:
+                    print(f"Analysed position {result['index']}", file=sys.stderr)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+
+
+async def _lines(lines: Iterable[str]) -> AsyncIterator[str]:
+    for line in lines:
+        yield line
+
+
+async def read_lines(read: Callable[[], Awaitable[bytes]]) -> AsyncIterator[str]:
+    """Splits a stream read chunk by chunk, e.g. an aiohttp request body, into lines."""
+    buffer = b""
+    while chunk := await read():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode()
+    if buffer:
+        yield buffer.decode()
+
+
+def _resume(path: str) -> int:
+    """Counts the finished results and drops a partly written last line."""
+    if not os.path.exists(path):
+        return 0
+    with open(path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        f.truncate(end)
+    return data[:end].count(b"\n")
@@ -0,0 +1,268 @@
+import argparse
+import asyncio
+import contextlib
+import inspect
+import itertools
+import json
+import os
+import platform
+import statistics
+import time
+import tracemalloc
+from collections import defaultdict
+from collections.abc import Callable
+
+from langchain_core.messages import HumanMessage
+from langchain_core.messages.utils import count_tokens_approximately
+
+import chess
+
+from ..api import DTO, Move
+from ..chess import Board
+from ..llm.encoding import PositionEncoding
+from ..llm.example import _build_example, get_example
+from ..llm.prompts import TemplateType, get_template
+from ..llm.tools import Toolbelt, _get_piece_info_on_square, _get_piece_map
+from .corpus import get_corpus
+
+# each benchmark prepares a board and returns the callable that is timed
+BENCHMARKS: dict[str, Callable[[Board], Callable]] = {}
+# benchmarks that don't depend on the position only run once
+GLOBAL_BENCHMARKS: dict[str, Callable[[], Callable]] = {}
+
+
+def benchmark(name: str, per_position: bool = True):
+    def decorator(func):
+        (BENCHMARKS if per_position else GLOBAL_BENCHMARKS)[name] = func
+        return func
+
+    return decorator
+
+
+@benchmark("get_piece_map")
+def _bench_piece_map(board: Board):
+    return lambda: _get_piece_map(board)
+
+
+@benchmark("get_piece_info_on_square")
+def _bench_piece_info(board: Board):
+    squares = itertools.cycle(board.piece_map())
+    return lambda: _get_piece_info_on_square(board, next(squares))
+
+
+@benchmark("analyse_move")
+def _bench_analyse_move(board: Board):
+    analyse_move = Toolbelt(board)["analyse_move"].func
+    moves = itertools.cycle([board.san(move) for move in board.legal_moves])
+    return lambda: analyse_move(next(moves))
+
+
+@benchmark("get_position")
+def _bench_get_position(board: Board):
+    return Toolbelt(board)["get_position"].func
+
+
+@benchmark("get_moves")
+def _bench_get_moves(board: Board):
+    return Toolbelt(board)["get_moves"].func
+
+
+@benchmark("get_template")
+def _bench_get_template(board: Board):
+    example = asyncio.run(get_example(TemplateType.STATE))
+
+    def run():
+        prompt_template = get_template(
+            [*example, *board.message_history], TemplateType.STATE
+        )
+        return prompt_template.invoke({"side_to_move": "white"})
+
+    return run
+
+
+@benchmark("dto_model_dump_json")
+def _bench_dto(board: Board):
+    move = Move.from_uci(next(iter(board.legal_moves)).uci())
+    return lambda: DTO(id=board.id, action="MOVE", move=move).model_dump_json()
+
+
+@benchmark("build_example", per_position=False)
+def _bench_build_example():
+    return lambda: _build_example(TemplateType.STATE)
+
+
+@benchmark("get_example", per_position=False)
+def _bench_get_example():
+    return lambda: get_example(TemplateType.STATE)
+
+
+def measure(func: Callable, iterations: int, warmup: int = 5) -> dict[str, float]:
+    loop = asyncio.new_event_loop()
+
+    def call():
+        # coroutine benchmarks are timed including one event loop round trip
+        result = func()
+        if inspect.isawaitable(result):
+            loop.run_until_complete(result)
+
+    for _ in range(warmup):
+        call()
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter_ns()
+        call()
+        timings.append(time.perf_counter_ns() - start)
+
+    peaks = []
+    tracemalloc.start()
+    for _ in range(min(iterations, 20)):
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        call()
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+    loop.close()
+
+    timings.sort()
+    return {
+        "calls": iterations,
+        "mean_us": statistics.fmean(timings) / 1000,
+        "p50_us": _percentile(timings, 50) / 1000,
+        "p90_us": _percentile(timings, 90) / 1000,
+        "p99_us": _percentile(timings, 99) / 1000,
+        "peak_alloc_bytes": statistics.median(peaks),
+    }
+
+
+def run(iterations: int = 200, name_filter: str | None = None) -> dict:
+    results = {}
+    for name, setup in GLOBAL_BENCHMARKS.items():
+        if name_filter and name_filter not in name:
+            continue
+        results[name] = measure(setup(), max(1, iterations // 10))
+
+    for category, boards in get_corpus().items():
+        for name, setup in BENCHMARKS.items():
+            if name_filter and name_filter not in name:
+                continue
+            per_board = iterations // len(boards)
+            timings = [measure(setup(board), per_board) for board in boards]
+            results[f"{name}/{category}"] = _merge(timings)
+    return {"python": platform.python_version(), "results": results}
+
+
+def token_report() -> dict[str, dict[str, float]]:
+    """Mean approximate tokens per tool output for each position encoding."""
+    corpus = [board for boards in get_corpus().values() for board in boards]
+    report = {}
+    for encoding in PositionEncoding:
+        outputs = defaultdict(list)
+        for board in corpus:
+            toolbelt = Toolbelt(board, encoding=encoding)
+            outputs["get_position"].append(toolbelt["get_position"].func())
+            for square in chess.SQUARES:
+                outputs["get_square_info"].append(
+                    toolbelt["get_square_info"].func(chess.square_name(square))
+                )
+            for move in board.legal_moves:
+                outputs["analyse_move"].append(
+                    toolbelt["analyse_move"].func(board.san(move))
+                )
+        report[encoding.value] = {
+            name: statistics.fmean(_count_tokens(text) for text in texts)
+            for name, texts in outputs.items()
+        }
+        example = asyncio.run(get_example(TemplateType.STATE, encoding))
+        report[encoding.value]["example_prefix"] = count_tokens_approximately(
+            list(example)
+        )
+    return report
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[str]:
+    regressions = []
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        ratio = result["p50_us"] / base["p50_us"] if base["p50_us"] else 1
+        if ratio > 1 + threshold:
+            regressions.append(
+                f"{name}: p50 {base['p50_us']:.1f}us -> {result['p50_us']:.1f}us ({ratio:.2f}x)"
+            )
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the CPU-side hot paths.")
+    parser.add_argument("-n", "--iterations", type=int, default=200)
+    parser.add_argument("-k", "--filter", help="only run benchmarks matching this")
+    parser.add_argument("--save", help="write the results as a JSON baseline")
+    parser.add_argument("--compare", help="JSON baseline to compare against")
+    parser.add_argument(
+        "--tokens",
+        action="store_true",
+        help="report tokens per tool output for each position encoding instead",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="relative p50 slowdown that counts as a regression",
+    )
+    args = parser.parse_args(argv)
+
+    if args.tokens:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            report = token_report()
+        encodings = list(report)
+        print(f"{'tool output':<20}" + "".join(f"{e:>12}" for e in encodings))
+        for name in report[encodings[0]]:
+            print(
+                f"{name:<20}" + "".join(f"{report[e][name]:>12.1f}" for e in encodings)
+            )
+        return 0
+
+    # the tools log every call, keep the report readable
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        report = run(args.iterations, args.filter)
+    print(
+        f"{'benchmark':<40} {'p50 us':>10} {'p90 us':>10} {'p99 us':>10} {'peak B':>10}"
+    )
+    for name, result in report["results"].items():
+        print(
+            f"{name:<40} {result['p50_us']:>10.1f} {result['p90_us']:>10.1f} "
+            f"{result['p99_us']:>10.1f} {result['peak_alloc_bytes']:>10.0f}"
+        )
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for regression in regressions:
+            print("Regression:", regression)
+        if regressions:
+            return 1
+    return 0
+
+
+def _merge(results: list[dict[str, float]]) -> dict[str, float]:
+    return {
+        "calls": sum(r["calls"] for r in results),
+        "mean_us": statistics.fmean(r["mean_us"] for r in results),
+        "p50_us": statistics.median(r["p50_us"] for r in results),
+        "p90_us": max(r["p90_us"] for r in results),
+        "p99_us": max(r["p99_us"] for r in results),
+        "peak_alloc_bytes": max(r["peak_alloc_bytes"] for r in results),
+    }
+
+
+def _count_tokens(text: str) -> int:
+    return count_tokens_approximately([HumanMessage(text)])
+
+
+def _percentile(values: list[int], percentile: float) -> float:
+    index = min(len(values) - 1, round(percentile / 100 * (len(values) - 1)))
+    return values[index]
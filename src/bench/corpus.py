@@ -0,0 +1,53 @@
+import random
+
+import chess
+
+from ..chess import Board
+
+OPENINGS = [
+    chess.STARTING_FEN,
+    "rnbqkb1r/pp2pppp/3p1n2/8/3NP3/8/PPP2PPP/RNBQKB1R w KQkq - 1 5",
+    "r1bqkbnr/pppp1ppp/2n5/1B2p3/4P3/5N2/PPPP1PPP/RNBQK2R b KQkq - 3 3",
+    "rnbqkb1r/ppp2ppp/4pn2/3p2B1/2PP4/2N5/PP2PPPP/R2QKBNR b KQkq - 3 4",
+]
+
+MIDDLEGAMES = [
+    "r1bq1rk1/pp2bppp/2n1pn2/3p4/2PP4/2N1PN2/PP1QBPPP/R3K2R w KQ - 4 10",
+    "r2q1rk1/1b2bppp/p2ppn2/1p6/3NP3/1BN1B3/PPP1QPPP/R4RK1 w - - 0 12",
+    "2rq1rk1/pb1nbppp/1p2pn2/2pp4/2PP4/1PN1PN2/PB1QBPPP/2RR2K1 w - - 4 13",
+    "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+]
+
+ENDGAMES = [
+    "8/5pk1/6p1/8/3R4/6P1/5PKP/3r4 w - - 0 40",
+    "8/8/4k3/3p4/3P4/4K3/8/8 w - - 0 50",
+    "6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1",
+    "8/2k5/8/2P5/3K4/8/8/8 w - - 0 60",
+]
+
+
+def long_game(plies: int = 120, seed: int = 0) -> Board:
+    """A board with a long move stack, played out with seeded random moves."""
+    rng = random.Random(seed)
+    board = Board("bench")
+    while len(board.move_stack) < plies and not board.is_game_over():
+        board.push(rng.choice(list(board.legal_moves)))
+    return board
+
+
+def get_corpus() -> dict[str, list[Board]]:
+    corpus = {}
+    for name, fens in [
+        ("opening", OPENINGS),
+        ("middlegame", MIDDLEGAMES),
+        ("endgame", ENDGAMES),
+    ]:
+        boards = []
+        for fen in fens:
+            board = Board("bench")
+            board.set_fen(fen)
+            board.fen0 = fen
+            boards.append(board)
+        corpus[name] = boards
+    corpus["long_game"] = [long_game(seed=seed) for seed in range(4)]
+    return corpus
@@ -1,21 +1,148 @@
 import random
-
-from websockets.asyncio.server import ServerConnection
+import threading
 
 import chess
+import chess.polyglot
+
+from .analysis import PositionAnalysis
+from .engine import Searcher
 
 
 class Board(chess.Board):
-    def __init__(self, board_id: str, websocket: ServerConnection):
-        super().__init__()
+    def __init__(
+        self,
+        board_id: str | None,
+        websocket=None,
+        *,
+        chess960: bool = False,
+    ):
+        # read-only tools fill in the journal from worker threads at the same time
+        self._journal_lock = threading.Lock()
+        super().__init__(chess960=chess960)
         self.id = board_id
         self.websocket = websocket
         self.markers = []
         self.message_history = []
         self.fen0 = self.starting_fen
+        self._analysis: PositionAnalysis | None = None
+
+    def analysis(self) -> PositionAnalysis:
+        """The analysis of the current position, rebuilt whenever the position changes."""
+        key = (
+            self.pawns,
+            self.knights,
+            self.bishops,
+            self.rooks,
+            self.queens,
+            self.kings,
+            self.occupied_co[chess.WHITE],
+            self.turn,
+            self.castling_rights,
+            self.ep_square,
+        )
+        if self._analysis is None or self._analysis.key != key:
+            self._analysis = PositionAnalysis(self, key)
+        return self._analysis
+
+    # The journal follows the move stack: the markers and the length of the chat
+    # before every move are kept on push, SAN and hashes are filled in on first use
+    # by replaying only the moves made since, on a board that trails this one. Read
+    # only tools fill it in from worker threads, so changes to it take the lock.
+
+    def clear_stack(self):
+        with self._journal_lock:
+            super().clear_stack()
+            self._snapshots: list[tuple[tuple[str, ...], int]] = []
+            self._san: list[str] = []
+            self._hashes: list[int] = []
+            self._journal: chess.Board | None = None
+            # entries of popped moves, python-chess pops and pushes back moves to look for repetitions
+            self._popped: list[tuple[chess.Move, tuple, str | None, int | None]] = []
+
+    def push(self, move: chess.Move):
+        with self._journal_lock:
+            popped = self._popped.pop() if self._popped else None
+            if popped is not None and popped[0] == move:
+                _, snapshot, san, hash = popped
+                if san is not None and len(self._san) == len(self.move_stack):
+                    self._san.append(san)
+                    self._hashes.append(hash)
+                    self._journal.push(move)
+            else:
+                self._popped.clear()
+                snapshot = (tuple(self.markers), len(self.message_history))
+            self._snapshots.append(snapshot)
+            super().push(move)
+
+    def pop(self) -> chess.Move:
+        with self._journal_lock:
+            move = super().pop()
+            san = hash = None
+            if len(self._san) > len(self.move_stack):
+                san, hash = self._san.pop(), self._hashes.pop()
+                self._journal.pop()
+            self._popped.append((move, self._snapshots.pop(), san, hash))
+            return move
+
+    def takeback(self, plies: int = 1) -> list[chess.Move]:
+        """Takes back moves along with the markers and chat that came after them."""
+        plies = max(0, min(plies, len(self.move_stack)))
+        if not plies:
+            return []
+        markers, history_length = self._snapshots[-plies]
+        moves = [self.pop() for _ in range(plies)]
+        with self._journal_lock:
+            self._popped.clear()
+        self.markers[:] = markers
+        # a compaction since the move may have shortened the chat, what it kept stays
+        del self.message_history[history_length:]
+        return moves
+
+    def san_history(self) -> str:
+        """The moves since the root position, numbered like variation_san."""
+        with self._journal_lock:
+            self._update_journal()
+            return " ".join(self._san)
+
+    def zobrist_hash(self) -> int:
+        with self._journal_lock:
+            self._update_journal()
+            return self._hashes[-1]
+
+    def _update_journal(self):
+        if self._journal is None:
+            self._journal = chess.Board(self.root().fen(), chess960=self.chess960)
+            self._hashes = [chess.polyglot.zobrist_hash(self._journal)]
+        journal = self._journal
+        while len(self._san) < len(self.move_stack):
+            move = self.move_stack[len(self._san)]
+            if journal.turn == chess.WHITE:
+                number = f"{journal.fullmove_number}. "
+            elif not self._san:
+                number = f"{journal.fullmove_number}..."
+            else:
+                number = ""
+            self._san.append(number + journal.san_and_push(move))
+            self._hashes.append(chess.polyglot.zobrist_hash(journal))
 
     def random_move(self) -> chess.Move:
         moves = list(self.legal_moves)
         move = random.choice(moves)
         self.push(move)
         return move
+
+    def engine_move(self, time_limit: float = 1.0) -> chess.Move:
+        move = Searcher(time_limit=time_limit).best_move(self)
+        self.push(move)
+        return move
+
+    def copy(self, *, stack: bool | int = True) -> "Board":
+        board = super().copy(stack=stack)
+        board.id = self.id
+        board.websocket = self.websocket
+        board.markers = list(self.markers)
+        board.message_history = list(self.message_history)
+        board.fen0 = self.fen0
+        if stack and board.move_stack:
+            board._snapshots = self._snapshots[-len(board.move_stack) :]
+        return board
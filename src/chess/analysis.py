@@ -0,0 +1,57 @@
+from collections import defaultdict
+
+import chess
+
+
+class PositionAnalysis:
+    """
+    Moves, attackers, pins and checkers of a single position. Everything is
+    computed on first use and kept, so repeated queries within a ply are cheap.
+    """
+
+    __slots__ = ("board", "key", "_moves_from", "_attackers", "_pinned", "_checkers")
+
+    def __init__(self, board: chess.Board, key: tuple):
+        self.board = board
+        self.key = key
+        self._moves_from: dict[chess.Square, list[chess.Move]] | None = None
+        # attacker bitboards indexed by color and square
+        self._attackers: list[list[int | None]] = [[None] * 64, [None] * 64]
+        self._pinned: dict[tuple[chess.Color, chess.Square], bool] = {}
+        self._checkers: chess.SquareSet | None = None
+
+    def moves_from(self, square: chess.Square) -> list[chess.Move]:
+        moves_from = self._moves_from
+        if moves_from is None:
+            # tools on other threads may ask at the same time, publish the map only once it is complete
+            moves_from = defaultdict(list)
+            for move in self.board.legal_moves:
+                moves_from[move.from_square].append(move)
+            self._moves_from = moves_from
+        return moves_from.get(square, [])
+
+    def attackers_mask(self, color: chess.Color, square: chess.Square) -> int:
+        mask = self._attackers[color][square]
+        if mask is None:
+            mask = self._attackers[color][square] = self.board.attackers_mask(
+                color, square
+            )
+        return mask
+
+    def attackers(self, color: chess.Color, square: chess.Square) -> chess.SquareSet:
+        return chess.SquareSet(self.attackers_mask(color, square))
+
+    def is_attacked_by(self, color: chess.Color, square: chess.Square) -> bool:
+        return bool(self.attackers_mask(color, square))
+
+    def is_pinned(self, color: chess.Color, square: chess.Square) -> bool:
+        pinned = self._pinned.get((color, square))
+        if pinned is None:
+            pinned = self._pinned[color, square] = self.board.is_pinned(color, square)
+        return pinned
+
+    @property
+    def checkers(self) -> chess.SquareSet:
+        if self._checkers is None:
+            self._checkers = self.board.checkers()
+        return self._checkers
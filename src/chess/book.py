@@ -0,0 +1,84 @@
+import argparse
+import os
+from collections import Counter
+
+import chess
+import chess.pgn
+import chess.polyglot
+
+
+class OpeningBook:
+    """Polyglot opening book, memory-mapped and searched by Zobrist key."""
+
+    def __init__(self, path: str, max_ply: int = 12, announce: bool = True):
+        self.reader = chess.polyglot.open_reader(path)
+        self.max_ply = max_ply
+        self.announce = announce
+
+    @staticmethod
+    def from_env() -> "OpeningBook | None":
+        path = os.getenv("OPENING_BOOK_PATH")
+        if not path:
+            return None
+        return OpeningBook(
+            path,
+            max_ply=int(os.getenv("OPENING_BOOK_MAX_PLY", "12")),
+            announce=os.getenv("OPENING_BOOK_ANNOUNCE", "1") == "1",
+        )
+
+    def choose(self, board: chess.Board) -> chess.Move | None:
+        if board.ply() >= self.max_ply:
+            return None
+        try:
+            return self.reader.weighted_choice(board).move
+        except IndexError:
+            return None
+
+    def close(self):
+        self.reader.close()
+
+
+def build_book(pgn_paths: list[str], output_path: str, max_ply: int = 16) -> int:
+    """Writes a Polyglot book with the moves played in the given PGN files, weighted by frequency."""
+    counts = Counter()
+    for pgn_path in pgn_paths:
+        with open(pgn_path) as pgn:
+            while (game := chess.pgn.read_game(pgn)) is not None:
+                board = game.board()
+                for move in game.mainline_moves():
+                    if board.ply() >= max_ply:
+                        break
+                    counts[
+                        chess.polyglot.zobrist_hash(board), _encode_move(board, move)
+                    ] += 1
+                    board.push(move)
+
+    with open(output_path, "wb") as book:
+        for (key, raw_move), count in sorted(counts.items()):
+            book.write(
+                chess.polyglot.ENTRY_STRUCT.pack(key, raw_move, min(count, 0xFFFF), 0)
+            )
+    return len(counts)
+
+
+def _encode_move(board: chess.Board, move: chess.Move) -> int:
+    to_square = move.to_square
+    if board.is_castling(move):
+        # Polyglot encodes castling as the king capturing its own rook
+        rank = chess.square_rank(move.from_square)
+        file = 7 if board.is_kingside_castling(move) else 0
+        to_square = chess.square(file, rank)
+    raw_move = to_square | move.from_square << 6
+    if move.promotion:
+        raw_move |= (move.promotion - 1) << 12
+    return raw_move
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a Polyglot opening book.")
+    parser.add_argument("pgn", nargs="+", help="PGN files to read the games from")
+    parser.add_argument("-o", "--output", default="book.bin")
+    parser.add_argument("--max-ply", type=int, default=16)
+    args = parser.parse_args()
+    entries = build_book(args.pgn, args.output, args.max_ply)
+    print(f"Wrote {entries} entries to {args.output}")
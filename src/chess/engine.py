@@ -0,0 +1,301 @@
+import time
+
+import chess
+import chess.polyglot
+
+PIECE_VALUES = {
+    chess.PAWN: 100,
+    chess.KNIGHT: 320,
+    chess.BISHOP: 330,
+    chess.ROOK: 500,
+    chess.QUEEN: 900,
+    chess.KING: 0,
+}
+
+# piece-square tables from white's point of view, listed from a8 to h1
+# fmt: off
+PIECE_SQUARE_TABLES = {
+    chess.PAWN: [
+        0, 0, 0, 0, 0, 0, 0, 0,
+        50, 50, 50, 50, 50, 50, 50, 50,
+        10, 10, 20, 30, 30, 20, 10, 10,
+        5, 5, 10, 25, 25, 10, 5, 5,
+        0, 0, 0, 20, 20, 0, 0, 0,
+        5, -5, -10, 0, 0, -10, -5, 5,
+        5, 10, 10, -20, -20, 10, 10, 5,
+        0, 0, 0, 0, 0, 0, 0, 0,
+    ],
+    chess.KNIGHT: [
+        -50, -40, -30, -30, -30, -30, -40, -50,
+        -40, -20, 0, 0, 0, 0, -20, -40,
+        -30, 0, 10, 15, 15, 10, 0, -30,
+        -30, 5, 15, 20, 20, 15, 5, -30,
+        -30, 0, 15, 20, 20, 15, 0, -30,
+        -30, 5, 10, 15, 15, 10, 5, -30,
+        -40, -20, 0, 5, 5, 0, -20, -40,
+        -50, -40, -30, -30, -30, -30, -40, -50,
+    ],
+    chess.BISHOP: [
+        -20, -10, -10, -10, -10, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 10, 10, 5, 0, -10,
+        -10, 5, 5, 10, 10, 5, 5, -10,
+        -10, 0, 10, 10, 10, 10, 0, -10,
+        -10, 10, 10, 10, 10, 10, 10, -10,
+        -10, 5, 0, 0, 0, 0, 5, -10,
+        -20, -10, -10, -10, -10, -10, -10, -20,
+    ],
+    chess.ROOK: [
+        0, 0, 0, 0, 0, 0, 0, 0,
+        5, 10, 10, 10, 10, 10, 10, 5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        0, 0, 0, 5, 5, 0, 0, 0,
+    ],
+    chess.QUEEN: [
+        -20, -10, -10, -5, -5, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 5, 5, 5, 0, -10,
+        -5, 0, 5, 5, 5, 5, 0, -5,
+        0, 0, 5, 5, 5, 5, 0, -5,
+        -10, 5, 5, 5, 5, 5, 0, -10,
+        -10, 0, 5, 0, 0, 0, 0, -10,
+        -20, -10, -10, -5, -5, -10, -10, -20,
+    ],
+    chess.KING: [
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -20, -30, -30, -40, -40, -30, -30, -20,
+        -10, -20, -20, -20, -20, -20, -20, -10,
+        20, 20, 0, 0, 0, 0, 20, 20,
+        20, 30, 10, 0, 0, 10, 30, 20,
+    ],
+}
+# fmt: on
+
+MATE_SCORE = 100_000
+INFINITY = 1_000_000
+
+EXACT, LOWER_BOUND, UPPER_BOUND = range(3)
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class Searcher:
+    """Iterative deepening alpha-beta search with a transposition table."""
+
+    def __init__(
+        self,
+        time_limit: float | None = 1.0,
+        node_limit: int | None = None,
+        max_depth: int = 32,
+        table_size: int = 1_000_000,
+    ):
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        self.max_depth = max_depth
+        self.table_size = table_size
+        self.table: dict[int, tuple[int, int, int, chess.Move | None]] = {}
+        self.nodes = 0
+        self.depth = 0
+        self._killers: dict[int, list[chess.Move | None]] = {}
+        self._deadline: float | None = None
+
+    def best_move(self, board: chess.Board) -> chess.Move:
+        return self.search(board)[0][0]
+
+    def search(
+        self, board: chess.Board, count: int = 1
+    ) -> list[tuple[chess.Move, int]]:
+        """Returns the best `count` moves with their scores in centipawns for the side to move."""
+        # a plain board, subclasses such as Board keep a journal on every push
+        plain = chess.Board(board.root().fen(), chess960=board.chess960)
+        for move in board.move_stack:
+            plain.push(move)
+        board = plain
+        root_moves = list(board.legal_moves)
+        if not root_moves:
+            return []
+        count = min(count, len(root_moves))
+        self.nodes = 0
+        self.depth = 0
+        self._killers = {}
+        self._deadline = (
+            time.perf_counter() + self.time_limit if self.time_limit else None
+        )
+        if len(self.table) > self.table_size:
+            self.table.clear()
+
+        result = [(move, 0) for move in root_moves[:count]]
+        for depth in range(1, self.max_depth + 1):
+            try:
+                scored = self._search_root(board, root_moves, depth, count)
+            except SearchTimeout:
+                break
+            result = scored[:count]
+            self.depth = depth
+            # search the best moves of this iteration first in the next one
+            ranked = [move for move, _ in scored]
+            root_moves = ranked + [move for move in root_moves if move not in ranked]
+            if abs(result[0][1]) > MATE_SCORE - self.max_depth:
+                break
+        return result
+
+    def _search_root(
+        self,
+        board: chess.Board,
+        root_moves: list[chess.Move],
+        depth: int,
+        count: int,
+    ) -> list[tuple[chess.Move, int]]:
+        scored = []
+        for move in root_moves:
+            # moves that can't make it into the top `count` are only searched for a bound
+            alpha = scored[count - 1][1] if len(scored) >= count else -INFINITY
+            board.push(move)
+            score = -self._negamax(board, depth - 1, -INFINITY, -alpha, 1)
+            board.pop()
+            if score > alpha:
+                scored.append((move, score))
+                scored.sort(key=lambda item: item[1], reverse=True)
+        return scored
+
+    def _negamax(
+        self, board: chess.Board, depth: int, alpha: int, beta: int, ply: int
+    ) -> int:
+        self._count_node()
+        if board.halfmove_clock >= 100 or (
+            board.halfmove_clock >= 4 and board.is_repetition(2)
+        ):
+            return 0
+        if board.is_insufficient_material():
+            return 0
+
+        in_check = board.is_check()
+        if depth <= 0 and not in_check:
+            return self._quiescence(board, alpha, beta, ply)
+
+        key = chess.polyglot.zobrist_hash(board)
+        entry = self.table.get(key)
+        table_move = None
+        if entry is not None:
+            entry_depth, entry_score, entry_flag, table_move = entry
+            if entry_depth >= depth:
+                if entry_flag == EXACT:
+                    return entry_score
+                if entry_flag == LOWER_BOUND and entry_score >= beta:
+                    return entry_score
+                if entry_flag == UPPER_BOUND and entry_score <= alpha:
+                    return entry_score
+
+        moves = self._order_moves(board, board.legal_moves, table_move, ply)
+        if not moves:
+            return -MATE_SCORE + ply if in_check else 0
+
+        original_alpha = alpha
+        best_score = -INFINITY
+        best_move = None
+        for move in moves:
+            is_capture = board.is_capture(move)
+            board.push(move)
+            score = -self._negamax(board, depth - 1, -beta, -alpha, ply + 1)
+            board.pop()
+            if score > best_score:
+                best_score = score
+                best_move = move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                if not is_capture:
+                    killers = self._killers.setdefault(ply, [None, None])
+                    if killers[0] != move:
+                        killers[1] = killers[0]
+                        killers[0] = move
+                break
+
+        if best_score <= original_alpha:
+            flag = UPPER_BOUND
+        elif best_score >= beta:
+            flag = LOWER_BOUND
+        else:
+            flag = EXACT
+        self.table[key] = (depth, best_score, flag, best_move)
+        return best_score
+
+    def _quiescence(self, board: chess.Board, alpha: int, beta: int, ply: int) -> int:
+        self._count_node()
+        stand_pat = evaluate(board)
+        if stand_pat >= beta:
+            return stand_pat
+        alpha = max(alpha, stand_pat)
+        captures = self._order_moves(board, board.generate_legal_captures(), None, ply)
+        for move in captures:
+            board.push(move)
+            score = -self._quiescence(board, -beta, -alpha, ply + 1)
+            board.pop()
+            if score >= beta:
+                return score
+            alpha = max(alpha, score)
+        return alpha
+
+    def _order_moves(
+        self,
+        board: chess.Board,
+        moves,
+        table_move: chess.Move | None,
+        ply: int,
+    ) -> list[chess.Move]:
+        killers = self._killers.get(ply, ())
+
+        def priority(move: chess.Move) -> int:
+            if move == table_move:
+                return 1_000_000
+            if board.is_capture(move):
+                # MVV-LVA: most valuable victim, least valuable attacker
+                victim = board.piece_type_at(move.to_square) or chess.PAWN
+                attacker = board.piece_type_at(move.from_square)
+                return 100_000 + PIECE_VALUES[victim] * 10 - PIECE_VALUES[attacker]
+            if move.promotion:
+                return 90_000 + PIECE_VALUES[move.promotion]
+            if move in killers:
+                return 80_000
+            return 0
+
+        return sorted(moves, key=priority, reverse=True)
+
+    def _count_node(self):
+        self.nodes += 1
+        if self.node_limit is not None and self.nodes > self.node_limit:
+            raise SearchTimeout()
+        if (
+            self._deadline is not None
+            and self.nodes % 1024 == 0
+            and time.perf_counter() > self._deadline
+        ):
+            raise SearchTimeout()
+
+
+def evaluate(board: chess.Board) -> int:
+    """Static evaluation in centipawns from the point of view of the side to move."""
+    score = 0
+    for piece_type, table in PIECE_SQUARE_TABLES.items():
+        value = PIECE_VALUES[piece_type]
+        for square in chess.scan_forward(board.pieces_mask(piece_type, chess.WHITE)):
+            score += value + table[chess.square_mirror(square)]
+        for square in chess.scan_forward(board.pieces_mask(piece_type, chess.BLACK)):
+            score -= value + table[square]
+    return score if board.turn == chess.WHITE else -score
+
+
+def format_score(score: int) -> str:
+    if abs(score) > MATE_SCORE - 1000:
+        moves = (MATE_SCORE - abs(score) + 1) // 2
+        return f"mate in {moves}" if score > 0 else f"mated in {moves}"
+    return f"{score / 100:+.2f}"
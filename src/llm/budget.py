@@ -0,0 +1,72 @@
+import os
+import time
+from enum import Enum
+
+
+class FallbackPolicy(str, Enum):
+    ENGINE = "engine"
+    RANDOM = "random"
+
+
+class TurnBudget:
+    """Limits on the model rounds, wall-clock time and tokens of one agent turn."""
+
+    def __init__(
+        self,
+        max_rounds: int = 8,
+        deadline: float = 30.0,
+        max_tokens: int | None = None,
+        commit_margin: float = 0.3,
+        fallback: FallbackPolicy = FallbackPolicy.ENGINE,
+        fallback_time_limit: float = 0.5,
+    ):
+        self.max_rounds = max_rounds
+        self.deadline = deadline
+        self.max_tokens = max_tokens
+        # the share of the budget left when the agent is asked to commit a move
+        self.commit_margin = commit_margin
+        self.fallback = fallback
+        self.fallback_time_limit = fallback_time_limit
+        self.start()
+
+    @staticmethod
+    def from_env() -> "TurnBudget":
+        max_tokens = int(os.getenv("TURN_MAX_TOKENS", "0"))
+        return TurnBudget(
+            max_rounds=int(os.getenv("TURN_MAX_ROUNDS", "8")),
+            deadline=float(os.getenv("TURN_DEADLINE", "30")),
+            max_tokens=max_tokens if max_tokens > 0 else None,
+            fallback=FallbackPolicy(os.getenv("TURN_FALLBACK", "engine")),
+        )
+
+    def start(self):
+        self.started = time.monotonic()
+        self.rounds = 0
+        self.tokens = 0
+        self.exceeded: str | None = None
+
+    def remaining(self) -> float:
+        return self.deadline - (time.monotonic() - self.started)
+
+    def spend(self, tokens: int):
+        self.rounds += 1
+        self.tokens += tokens
+
+    def exhausted(self) -> str | None:
+        """The name of the first limit that has been reached, if any."""
+        if self.rounds >= self.max_rounds:
+            return "rounds"
+        if self.remaining() <= 0:
+            return "deadline"
+        if self.max_tokens is not None and self.tokens >= self.max_tokens:
+            return "tokens"
+        return None
+
+    def running_low(self) -> bool:
+        if self.rounds + 1 >= self.max_rounds:
+            return True
+        if self.remaining() <= self.deadline * self.commit_margin:
+            return True
+        if self.max_tokens is None:
+            return False
+        return self.tokens >= self.max_tokens * (1 - self.commit_margin)
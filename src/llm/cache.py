@@ -0,0 +1,139 @@
+import json
+import os
+import random
+import sqlite3
+import time
+from collections import Counter, OrderedDict
+from enum import Enum
+
+from pydantic import BaseModel
+
+import chess
+
+from ..chess import Board
+from .prompts import TemplateType
+
+
+class CachePolicy(str, Enum):
+    ALWAYS = "always"
+    SAMPLE = "sample"
+
+
+class CachedDecision(BaseModel):
+    move: str
+    messages: list[str] = []
+
+
+class DecisionCache:
+    """Move decisions of the agent keyed by position, model and template."""
+
+    def __init__(
+        self,
+        max_size: int = 10_000,
+        ttl: float | None = None,
+        policy: CachePolicy = CachePolicy.ALWAYS,
+        reuse_probability: float = 0.8,
+        max_variants: int = 3,
+        path: str | None = None,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.policy = policy
+        self.reuse_probability = reuse_probability
+        self.max_variants = max_variants
+        self.stats = Counter()
+        self._entries: OrderedDict[str, tuple[float, list[CachedDecision]]] = (
+            OrderedDict()
+        )
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS decisions (key TEXT PRIMARY KEY, created REAL, value TEXT)"
+            )
+
+    @staticmethod
+    def from_env() -> "DecisionCache | None":
+        max_size = int(os.getenv("DECISION_CACHE_SIZE", "0"))
+        if max_size <= 0:
+            return None
+        ttl = os.getenv("DECISION_CACHE_TTL")
+        return DecisionCache(
+            max_size=max_size,
+            ttl=float(ttl) if ttl else None,
+            policy=CachePolicy(os.getenv("DECISION_CACHE_POLICY", "always")),
+            reuse_probability=float(
+                os.getenv("DECISION_CACHE_REUSE_PROBABILITY", "0.8")
+            ),
+            path=os.getenv("DECISION_CACHE_PATH"),
+        )
+
+    @staticmethod
+    def key(board: Board, model_name: str, template_type: TemplateType) -> str:
+        return f"{board.zobrist_hash():016x}:{model_name}:{template_type.name}"
+
+    def get(self, key: str, board: Board) -> CachedDecision | None:
+        decisions = self._load(key)
+        if not decisions:
+            self.stats["misses"] += 1
+            return None
+        if self.policy == CachePolicy.SAMPLE:
+            # leave room for new variants so the same position is not always played the same way
+            if (
+                len(decisions) < self.max_variants
+                and random.random() > self.reuse_probability
+            ):
+                self.stats["skipped"] += 1
+                return None
+            decision = random.choice(decisions)
+        else:
+            decision = decisions[0]
+        if not board.is_legal(chess.Move.from_uci(decision.move)):
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return decision
+
+    def put(self, key: str, decision: CachedDecision):
+        decisions = self._load(key) or []
+        if decision in decisions:
+            return
+        decisions = [*decisions, decision][-self.max_variants :]
+        created = time.time()
+        self._store(key, created, decisions)
+        if self._db is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO decisions VALUES (?, ?, ?)",
+                (key, created, json.dumps([d.model_dump() for d in decisions])),
+            )
+            self._db.commit()
+
+    def _load(self, key: str) -> list[CachedDecision] | None:
+        entry = self._entries.get(key)
+        if entry is None and self._db is not None:
+            row = self._db.execute(
+                "SELECT created, value FROM decisions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                entry = (
+                    row[0],
+                    [CachedDecision.model_validate(d) for d in json.loads(row[1])],
+                )
+                self._store(key, *entry)
+        if entry is None:
+            return None
+        created, decisions = entry
+        if self.ttl is not None and time.time() - created > self.ttl:
+            self._entries.pop(key, None)
+            if self._db is not None:
+                self._db.execute("DELETE FROM decisions WHERE key = ?", (key,))
+                self._db.commit()
+            return None
+        self._entries.move_to_end(key)
+        return decisions
+
+    def _store(self, key: str, created: float, decisions: list[CachedDecision]):
+        self._entries[key] = (created, decisions)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
@@ -0,0 +1,149 @@
+import hashlib
+import json
+import sqlite3
+from typing import Any
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import ConfigDict
+
+from .. import metrics
+from .fake import FakeChatModel
+
+
+class CassetteMissError(LookupError):
+    pass
+
+
+class Cassette:
+    """Model responses on disk, keyed by the model and the normalized prompt."""
+
+    def __init__(self, path: str):
+        self._db = sqlite3.connect(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT)"
+        )
+
+    @staticmethod
+    def key(model_name: str, messages: list[BaseMessage]) -> str:
+        prompt = json.dumps(
+            [model_name, [_normalize(m) for m in messages]],
+            sort_keys=True,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(prompt.encode()).hexdigest()[:32]
+
+    def get(self, key: str) -> AIMessage | None:
+        row = self._db.execute(
+            "SELECT value FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value = json.loads(row[0])
+        return AIMessage(
+            content=value["content"],
+            tool_calls=[
+                {"name": name, "args": args, "id": id}
+                for name, args, id in value["tool_calls"]
+            ],
+            usage_metadata=value["usage"],
+        )
+
+    def put(self, key: str, message: AIMessage):
+        value = {
+            "content": message.content,
+            "tool_calls": [[c["name"], c["args"], c["id"]] for c in message.tool_calls],
+            "usage": message.usage_metadata,
+        }
+        self._db.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?)",
+            (key, json.dumps(value, separators=(",", ":"))),
+        )
+        self._db.commit()
+
+
+def _normalize(message: BaseMessage) -> list:
+    # tool call ids and whitespace differ between runs of the same turn
+    normalized = [message.type, " ".join(message.text.split())]
+    if isinstance(message, AIMessage):
+        normalized.append([[c["name"], c["args"]] for c in message.tool_calls])
+    elif isinstance(message, ToolMessage):
+        normalized.append(message.name)
+    return normalized
+
+
+class RecordingChatModel(BaseChatModel):
+    """
+    Answers from the cassette where it can and asks the wrapped model otherwise,
+    recording its response.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    model: Any
+    cassette: Cassette
+    model_name: str
+    bound: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "record"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.model_copy(update={"bound": self.model.bind_tools(tools, **kwargs)})
+
+    def _generate(
+        self, messages: list[BaseMessage], stop=None, run_manager=None, **kwargs
+    ):
+        key = self.cassette.key(self.model_name, messages)
+        response = self._replay(key)
+        if response is None:
+            response = (self.bound or self.model).invoke(messages)
+            self._record(key, response)
+        return ChatResult(generations=[ChatGeneration(message=response)])
+
+    async def _agenerate(
+        self, messages: list[BaseMessage], stop=None, run_manager=None, **kwargs
+    ):
+        key = self.cassette.key(self.model_name, messages)
+        response = self._replay(key)
+        if response is None:
+            response = await (self.bound or self.model).ainvoke(messages)
+            self._record(key, response)
+        return ChatResult(generations=[ChatGeneration(message=response)])
+
+    def _replay(self, key: str) -> AIMessage | None:
+        response = self.cassette.get(key)
+        if response is not None:
+            metrics.cassette_events.inc(event="hit")
+        return response
+
+    def _record(self, key: str, response: AIMessage):
+        self.cassette.put(key, response)
+        metrics.cassette_events.inc(event="recorded")
+
+
+class ReplayChatModel(FakeChatModel):
+    """
+    Replays recorded responses after a simulated latency. A prompt that was not
+    recorded fails the model call, like an unavailable provider would.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    cassette: Cassette
+    model_name: str
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay"
+
+    def _respond(self, messages: list[BaseMessage]) -> ChatResult:
+        response = self.cassette.get(self.cassette.key(self.model_name, messages))
+        if response is None:
+            metrics.cassette_events.inc(event="miss")
+            raise CassetteMissError("No recorded response for this prompt")
+        metrics.cassette_events.inc(event="hit")
+        return ChatResult(generations=[ChatGeneration(message=response)])
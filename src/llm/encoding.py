@@ -0,0 +1,112 @@
+import os
+from collections.abc import Iterable
+from enum import Enum
+
+import chess
+
+from ..chess import Board
+from .prompts import TemplateType
+from .utils import get_color_name
+
+
+class PositionEncoding(str, Enum):
+    VERBOSE = "verbose"
+    COMPACT = "compact"
+
+
+DEFAULT_ENCODING = PositionEncoding.VERBOSE
+# small models read the board more reliably in plain sentences
+MODEL_ENCODINGS = {
+    "gpt-4o": PositionEncoding.COMPACT,
+    "gpt-4o-mini": PositionEncoding.COMPACT,
+    "llama3.2": PositionEncoding.VERBOSE,
+}
+TEMPLATE_ENCODINGS: dict[TemplateType, PositionEncoding] = {}
+
+
+def get_encoding(
+    model_name: str, template_type: TemplateType | None = None
+) -> PositionEncoding:
+    configured = os.getenv("POSITION_ENCODING")
+    if configured:
+        return PositionEncoding(configured)
+    if template_type in TEMPLATE_ENCODINGS:
+        return TEMPLATE_ENCODINGS[template_type]
+    return MODEL_ENCODINGS.get(model_name, DEFAULT_ENCODING)
+
+
+def compact_pieces(board: Board, squares: Iterable[chess.Square]) -> str:
+    """Pieces as symbol and square, e.g. "Nf3 ph6", uppercase for white."""
+    return (
+        " ".join(f"{board.piece_at(s).symbol()}{chess.square_name(s)}" for s in squares)
+        or "-"
+    )
+
+
+def compact_squares(squares: Iterable[chess.Square]) -> str:
+    return " ".join(chess.square_name(s) for s in squares) or "-"
+
+
+def compact_grid(board: Board) -> str:
+    rows = []
+    for rank in range(7, -1, -1):
+        pieces = [board.piece_at(chess.square(file, rank)) for file in range(8)]
+        rows.append(f"{rank + 1} " + " ".join(p.symbol() if p else "." for p in pieces))
+    rows.append("  a b c d e f g h")
+    return "\n".join(rows)
+
+
+def compact_position(board: Board) -> str:
+    _, _, castling, en_passant, *_ = board.fen().split(" ")
+    analysis = board.analysis()
+    attacked = [
+        s
+        for s, p in board.piece_map().items()
+        if analysis.is_attacked_by(not p.color, s)
+    ]
+    lines = [
+        "Board (uppercase is white):",
+        compact_grid(board),
+        f"{get_color_name(board.turn).title()} to move. Castling: {castling}. En passant: {en_passant}.",
+        f"Attacked pieces: {compact_pieces(board, sorted(attacked, reverse=True))}",
+    ]
+    if analysis.checkers:
+        lines.append(f"Check by: {compact_pieces(board, analysis.checkers)}")
+    return "\n".join(lines)
+
+
+def compact_attackers(board: Board, square: chess.Square) -> str:
+    analysis = board.analysis()
+    piece = board.piece_at(square)
+    if piece is None:
+        return (
+            f"White attackers: {compact_pieces(board, analysis.attackers(chess.WHITE, square))}\n"
+            f"Black attackers: {compact_pieces(board, analysis.attackers(chess.BLACK, square))}"
+        )
+    return (
+        f"Defenders: {compact_pieces(board, analysis.attackers(piece.color, square))}\n"
+        f"Attackers: {compact_pieces(board, analysis.attackers(not piece.color, square))}"
+    )
+
+
+def compact_square_info(board: Board, square: chess.Square) -> str:
+    piece = board.piece_at(square)
+    name = chess.square_name(square)
+    if piece is None:
+        return f"{name}: empty\n{compact_attackers(board, square)}"
+    result = f"{piece.symbol()}{name} ({get_color_name(piece.color)} {chess.piece_name(piece.piece_type)})\n"
+    analysis = board.analysis()
+    moves = [m.to_square for m in analysis.moves_from(square)]
+    if moves:
+        result += f"Moves: {compact_squares(moves)}\n"
+    else:
+        if board.turn != piece.color:
+            reason = "not its turn"
+        elif analysis.is_pinned(piece.color, square):
+            reason = "pinned"
+        elif analysis.checkers:
+            reason = "check"
+        else:
+            reason = "blocked"
+        result += f"Moves: none ({reason}). Attacks: {compact_squares(board.attacks(square))}\n"
+    return result + compact_attackers(board, square)
@@ -0,0 +1,139 @@
+import asyncio
+import random
+import time
+import uuid
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+import chess
+
+from .prompts import COMMIT_MOVE_REQUEST, TemplateType
+
+MOVE_REQUESTS = {
+    COMMIT_MOVE_REQUEST,
+    *(
+        template.value.format(side_to_move=side)
+        for template in TemplateType
+        for side in ("white", "black")
+    ),
+}
+OUTPUT_TOKENS = 20
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    A stand-in for a chat model in load tests and profiling. It answers with the
+    next round of a fixed script after a simulated latency, so no network or API
+    key is needed. Move turns look the position up and play a legal move through
+    make_move, the same move for the same position.
+    """
+
+    latency: float = 0.5
+    jitter: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def bind_tools(self, tools, **kwargs):
+        # the script only calls tools every agent has
+        return self
+
+    def _generate(
+        self, messages: list[BaseMessage], stop=None, run_manager=None, **kwargs
+    ):
+        time.sleep(self._delay())
+        return self._respond(messages)
+
+    async def _agenerate(
+        self, messages: list[BaseMessage], stop=None, run_manager=None, **kwargs
+    ):
+        await asyncio.sleep(self._delay())
+        return self._respond(messages)
+
+    def _delay(self) -> float:
+        return max(0.0, random.gauss(self.latency, self.jitter))
+
+    def _respond(self, messages: list[BaseMessage]) -> ChatResult:
+        return _result(messages, self._script(messages))
+
+    def _script(self, messages: list[BaseMessage]) -> list[tuple[str, dict]]:
+        # the model rounds since the last human message tell how far the turn is
+        turn = []
+        for message in reversed(messages):
+            if isinstance(message, HumanMessage):
+                move_turn = message.content in MOVE_REQUESTS
+                break
+            turn.append(message)
+        else:
+            move_turn = False
+        rounds = sum(isinstance(message, AIMessage) for message in turn)
+        if rounds == 0:
+            return (
+                [("get_position", {}), ("get_moves", {})]
+                if move_turn
+                else [("get_position", {})]
+            )
+        if rounds > 1:
+            return [("stop_interaction", {})]
+        if not move_turn:
+            return [
+                ("send_message", {"message": "Let me take a look at the position."})
+            ]
+        move = _choose_move(turn)
+        if move is None:
+            # the turn ends with the fallback move
+            return [("stop_interaction", {})]
+        return [
+            ("send_message", {"message": f"I will play {move}."}),
+            ("make_move", {"move": move}),
+        ]
+
+
+def _choose_move(turn: list[BaseMessage]) -> str | None:
+    """Replays the move history get_moves returned and picks a legal move."""
+    history = next(
+        (
+            m.content
+            for m in turn
+            if isinstance(m, ToolMessage) and m.name == "get_moves"
+        ),
+        None,
+    )
+    if history is None:
+        return None
+    board = chess.Board()
+    if history.startswith("Moves made: "):
+        try:
+            for token in history.removeprefix("Moves made: ").split():
+                if not token[0].isdigit():
+                    board.push_san(token)
+        except ValueError:
+            # the game started from a position get_moves does not tell
+            return None
+    elif not history.startswith("No moves"):
+        return None
+    moves = sorted(board.legal_moves, key=chess.Move.uci)
+    if not moves:
+        return None
+    return board.san(random.Random(board.fen()).choice(moves))
+
+
+def _result(messages: list[BaseMessage], calls: list[tuple[str, dict]]) -> ChatResult:
+    input_tokens = count_tokens_approximately(messages)
+    message = AIMessage(
+        content="",
+        tool_calls=[
+            {"name": name, "args": args, "id": f"fake_{uuid.uuid4().hex}"}
+            for name, args in calls
+        ],
+        usage_metadata={
+            "input_tokens": input_tokens,
+            "output_tokens": OUTPUT_TOKENS,
+            "total_tokens": input_tokens + OUTPUT_TOKENS,
+        },
+    )
+    return ChatResult(generations=[ChatGeneration(message=message)])
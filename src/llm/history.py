@@ -0,0 +1,95 @@
+from collections.abc import Awaitable, Callable
+
+from langchain_core.messages import BaseMessage, HumanMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+
+TOKEN_BUDGETS = {
+    "gpt-4o": 16_000,
+    "gpt-4o-mini": 16_000,
+    "llama3.2": 4_000,
+}
+DEFAULT_TOKEN_BUDGET = 4_000
+RECENT_MESSAGES = 10
+SUMMARY_ID = "history_summary"
+SUMMARY_LINE_LENGTH = 200
+
+POSITION_TOOLS = {
+    "get_position",
+    "get_moves",
+    "get_square_info",
+    "analyse_move",
+    "evaluate_candidates",
+}
+STALE_TOOL_OUTPUT = "Outdated: the position has changed since this call."
+
+Summarizer = Callable[[str, list[BaseMessage]], Awaitable[str]]
+
+
+def get_token_budget(model_name: str) -> int:
+    return TOKEN_BUDGETS.get(model_name, DEFAULT_TOKEN_BUDGET)
+
+
+async def compact_history(
+    message_history: list[BaseMessage],
+    token_budget: int,
+    summarize: Summarizer | None = None,
+):
+    """Folds everything but the recent messages into a rolling summary once the history is over budget."""
+    if count_tokens_approximately(message_history) <= token_budget:
+        return
+    start = 0
+    previous_summary = ""
+    if message_history and message_history[0].id == SUMMARY_ID:
+        start = 1
+        previous_summary = message_history[0].content
+    older = message_history[start:-RECENT_MESSAGES]
+    recent = message_history[-RECENT_MESSAGES:]
+    if not older:
+        return
+
+    if summarize is not None:
+        summary = await summarize(previous_summary, older)
+    else:
+        summary = _extractive_summary(previous_summary, older, token_budget // 4)
+    message_history[:] = [
+        HumanMessage(content=summary, id=SUMMARY_ID),
+        *recent,
+    ]
+
+
+def drop_stale_tool_outputs(messages: list, start: int):
+    """Replaces position-specific tool outputs of the current turn once a move has been made."""
+    for i in range(len(messages) - 1, start - 1, -1):
+        message = messages[i]
+        if (
+            isinstance(message, ToolMessage)
+            and message.name == "make_move"
+            and message.content.startswith("Move made")
+        ):
+            break
+    else:
+        return
+    for j in range(start, i):
+        message = messages[j]
+        if (
+            isinstance(message, ToolMessage)
+            and message.name in POSITION_TOOLS
+            and message.content != STALE_TOOL_OUTPUT
+        ):
+            messages[j] = message.model_copy(update={"content": STALE_TOOL_OUTPUT})
+
+
+def _extractive_summary(
+    previous_summary: str, messages: list[BaseMessage], token_budget: int
+) -> str:
+    lines = previous_summary.splitlines()[1:] if previous_summary else []
+    for message in messages:
+        role = "User" if message.type == "human" else "Assistant"
+        text = " ".join(message.text.split())
+        if len(text) > SUMMARY_LINE_LENGTH:
+            text = text[:SUMMARY_LINE_LENGTH].rsplit(" ", 1)[0] + "..."
+        lines.append(f"{role}: {text}")
+    # the oldest lines go first when the summary itself gets too long
+    while len(lines) > 1 and sum(len(line) for line in lines) / 4 > token_budget:
+        lines.pop(0)
+    return "\n".join(["Summary of the earlier conversation:", *lines])
@@ -10,6 +10,7 @@ You use tools to get information about the chessboard, here is a helpful example
     - You can use the 'get_moves' tool to get the move history if available.
     - You can use the 'get_square_info' tool to get information about the piece on a specific square, including its legal moves, attackers, and defenders.
     - You can use the 'analyse_move' tool to get information about a specific move, including its legality and whether it is a check.
+    - You can use the 'evaluate_candidates' tool to get the best candidate moves and their scores from a chess engine.
 
 ALWAYS consider the current position and the attacked pieces before making a move.
 NEVER say anything about the position or make a move without using the tools. You make your move using the 'make_move' tool.
@@ -19,6 +20,12 @@ Once you finished your task, you will stop the interaction using the 'stop_inter
 ALWAYS respond with tool calls. NEVER say anything without using the tools.
 """
 
+SUMMARY_MESSAGE = """You summarize conversations between a user and a chess assistant. Keep every question, claim and plan that could matter later in the game, and drop small talk."""
+
+SUMMARY_REQUEST = "Summarize the conversation so far in a few short sentences."
+
+COMMIT_MOVE_REQUEST = "You are running out of time for this move. Make your move now using the 'make_move' tool."
+
 TEMPLATE_STATE = "Make the best move for {side_to_move}."
 
 
@@ -30,6 +37,7 @@ def get_template(
     message_history: list[BaseMessage],
     template_type: TemplateType | None,
 ) -> ChatPromptTemplate:
+    # keep the static parts first so providers can reuse the cached prompt prefix
     messages = [("system", SYSTEM_MESSAGE)]
     messages.extend(message_history)
     if template_type:
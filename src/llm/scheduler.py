@@ -0,0 +1,143 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from collections import Counter, deque
+from collections.abc import Awaitable, Callable
+from enum import IntEnum
+
+
+class Priority(IntEnum):
+    MOVE = 0
+    CHAT = 1
+    PONDER = 2
+
+
+class QueueFullError(Exception):
+    pass
+
+
+TOKEN_WINDOW = 60.0
+
+
+class ProviderScheduler:
+    """
+    Admits the model calls of one provider and model within a concurrency and a
+    tokens-per-minute limit. Waiting calls are served by priority, then in order.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        tokens_per_minute: int | None = None,
+        max_queue: int = 100,
+    ):
+        self.max_concurrency = max_concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.max_queue = max_queue
+        self.active = 0
+        self.stats = Counter()
+        self._queue: list[tuple[int, int, int, asyncio.Future]] = []
+        self._order = itertools.count()
+        # tokens of finished calls in the last minute, and of the running ones
+        self._used: deque[tuple[float, int]] = deque()
+        self._reserved = 0
+        self._timer: asyncio.TimerHandle | None = None
+
+    @staticmethod
+    def from_env(max_concurrency: int) -> "ProviderScheduler":
+        tokens_per_minute = int(os.getenv("MODEL_TOKENS_PER_MINUTE", "0"))
+        return ProviderScheduler(
+            max_concurrency=int(os.getenv("MODEL_MAX_CONCURRENCY", max_concurrency)),
+            tokens_per_minute=tokens_per_minute if tokens_per_minute > 0 else None,
+            max_queue=int(os.getenv("MODEL_MAX_QUEUE", "100")),
+        )
+
+    @property
+    def queued(self) -> int:
+        return len(self._queue)
+
+    async def acquire(
+        self,
+        priority: Priority,
+        tokens: int,
+        on_queued: Callable[[int], Awaitable] | None = None,
+    ):
+        """Waits for a slot for a call expected to use the given number of tokens."""
+        if not self._queue and self._can_start(tokens):
+            self._start(tokens)
+            return
+        if len(self._queue) >= self.max_queue:
+            self.stats["rejected"] += 1
+            raise QueueFullError("Too many model calls are waiting")
+
+        entry = (
+            priority,
+            next(self._order),
+            tokens,
+            asyncio.get_running_loop().create_future(),
+        )
+        heapq.heappush(self._queue, entry)
+        self.stats["queued"] += 1
+        self._schedule_retry()
+        try:
+            if on_queued is not None:
+                await on_queued(sorted(self._queue).index(entry) + 1)
+            await entry[3]
+        except asyncio.CancelledError:
+            if entry[3].done() and not entry[3].cancelled():
+                # the slot was granted while we were being cancelled
+                self.release(tokens, 0)
+            elif entry in self._queue:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+            raise
+
+    def release(self, reserved: int, used: int):
+        self.active -= 1
+        self._reserved -= reserved
+        if self.tokens_per_minute is not None:
+            self._used.append((time.monotonic(), used))
+        self._dispatch()
+
+    def _start(self, tokens: int):
+        self.active += 1
+        self._reserved += tokens
+
+    def _can_start(self, tokens: int) -> bool:
+        if self.active >= self.max_concurrency:
+            return False
+        if self.tokens_per_minute is None:
+            return True
+        in_use = self._tokens_in_window() + self._reserved
+        # a call larger than the whole limit still runs once nothing else does
+        return in_use == 0 or in_use + tokens <= self.tokens_per_minute
+
+    def _tokens_in_window(self) -> int:
+        cutoff = time.monotonic() - TOKEN_WINDOW
+        while self._used and self._used[0][0] < cutoff:
+            self._used.popleft()
+        return sum(tokens for _, tokens in self._used)
+
+    def _dispatch(self):
+        while self._queue and self._can_start(self._queue[0][2]):
+            _, _, tokens, future = heapq.heappop(self._queue)
+            if future.done():
+                continue
+            self._start(tokens)
+            future.set_result(None)
+        self._schedule_retry()
+
+    def _schedule_retry(self):
+        # calls held back by the token limit are retried once old usage leaves the window
+        if not self._queue or self._timer is not None or not self._used:
+            return
+        if self.active >= self.max_concurrency:
+            return
+        delay = max(0.0, self._used[0][0] + TOKEN_WINDOW - time.monotonic())
+        self._timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
@@ -1,12 +1,48 @@
+import asyncio
+import itertools
+import os
+import random
+import time
+from collections.abc import Awaitable, Callable
 from enum import Enum
+from functools import partial
 
-from langchain_core.messages import BaseMessage, HumanMessage, ToolMessage
+import httpx
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    SystemMessage,
+    ToolMessage,
+)
+from langchain_core.messages.utils import (
+    count_tokens_approximately,
+    message_chunk_to_message,
+)
+from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import Runnable
 from langchain_core.tools import BaseTool
+from pydantic import BaseModel
 
+from .. import metrics
+from ..api import DTO, Move
 from ..chess import Board
+from ..chess.book import OpeningBook
+from ..chess.engine import Searcher
+from .budget import FallbackPolicy, TurnBudget
+from .cache import CachedDecision, DecisionCache
+from .encoding import get_encoding
 from .example import get_example
-from .prompts import TemplateType, get_template
+from .history import compact_history, drop_stale_tool_outputs, get_token_budget
+from .prompts import (
+    COMMIT_MOVE_REQUEST,
+    SUMMARY_MESSAGE,
+    SUMMARY_REQUEST,
+    TemplateType,
+    get_template,
+)
+from .scheduler import Priority, ProviderScheduler, QueueFullError
 from .tools import InteractionFinishedException, Toolbelt
 from .utils import get_color_name
 
@@ -14,29 +50,219 @@ from .utils import get_color_name
 class ModelProvider(str, Enum):
     OPENAI = "openai"
     OLLAMA = "ollama"
+    FAKE = "fake"
+    RECORD = "record"
+    REPLAY = "replay"
 
 
-def _get_model(
-    provider: ModelProvider, model_name: str, tools: list[BaseTool]
-) -> Runnable:
+class TurnReport(BaseModel):
+    """How a move turn was decided, for callers that keep statistics."""
+
+    source: str
+    rounds: int = 0
+    tokens: int = 0
+    illegal_moves: int = 0
+    exceeded: str | None = None
+
+
+HTTP_LIMITS = httpx.Limits(
+    max_connections=100, max_keepalive_connections=20, keepalive_expiry=30
+)
+
+# concurrent calls per provider, a local Ollama instance only handles a few
+PROVIDER_CONCURRENCY = {
+    ModelProvider.OPENAI: 16,
+    ModelProvider.OLLAMA: 2,
+    ModelProvider.FAKE: 64,
+    ModelProvider.REPLAY: 64,
+}
+RATE_LIMIT_RETRIES = 4
+RATE_LIMIT_BACKOFF = 1.0
+
+_models: dict[tuple[ModelProvider, str], BaseChatModel] = {}
+_bound_models: dict[tuple[ModelProvider, str, tuple[str, ...]], Runnable] = {}
+
+
+def _create_model(provider: ModelProvider, model_name: str) -> BaseChatModel:
     match provider:
         case ModelProvider.OPENAI:
             from langchain_openai import ChatOpenAI
 
-            model = ChatOpenAI(model=model_name)
+            return ChatOpenAI(
+                model=model_name,
+                stream_usage=True,
+                # failed calls are retried by _call_model, outside the scheduler slot
+                max_retries=0,
+                http_async_client=httpx.AsyncClient(limits=HTTP_LIMITS),
+            )
         case ModelProvider.OLLAMA:
             from langchain_ollama import ChatOllama
 
-            model = ChatOllama(model=model_name)
+            return ChatOllama(
+                model=model_name,
+                async_client_kwargs={"limits": HTTP_LIMITS},
+            )
+        case ModelProvider.FAKE:
+            from .fake import FakeChatModel
+
+            return FakeChatModel(
+                latency=float(os.getenv("FAKE_MODEL_LATENCY", "0.5")),
+                jitter=float(os.getenv("FAKE_MODEL_JITTER", "0")),
+            )
+        case ModelProvider.RECORD:
+            from .cassette import Cassette, RecordingChatModel
+
+            return RecordingChatModel(
+                model=_create_model(
+                    ModelProvider(os.getenv("RECORD_PROVIDER", "openai")), model_name
+                ),
+                cassette=Cassette(os.getenv("CASSETTE_PATH", "cassette.db")),
+                model_name=model_name,
+            )
+        case ModelProvider.REPLAY:
+            from .cassette import Cassette, ReplayChatModel
+
+            return ReplayChatModel(
+                cassette=Cassette(os.getenv("CASSETTE_PATH", "cassette.db")),
+                model_name=model_name,
+                latency=float(os.getenv("REPLAY_LATENCY", "0")),
+                jitter=float(os.getenv("REPLAY_JITTER", "0")),
+            )
         case _:
             raise ValueError(f"Unsupported model provider: {provider}")
 
-    if tools:
-        model = model.bind_tools(tools)
 
+def _get_chat_model(provider: ModelProvider, model_name: str) -> BaseChatModel:
+    key = (provider, model_name)
+    model = _models.get(key)
+    if model is None:
+        model = _models[key] = _create_model(provider, model_name)
+    return model
+
+
+def _get_model(
+    provider: ModelProvider, model_name: str, tools: list[BaseTool]
+) -> Runnable:
+    if not tools:
+        return _get_chat_model(provider, model_name)
+
+    # only the tool schemas are bound, the per-board tools are run by the Toolbelt
+    key = (provider, model_name, tuple(t.name for t in tools))
+    model = _bound_models.get(key)
+    if model is None:
+        model = _bound_models[key] = _get_chat_model(provider, model_name).bind_tools(
+            tools
+        )
     return model
 
 
+_schedulers: dict[tuple[ModelProvider, str], ProviderScheduler] = {}
+
+metrics.Observed(
+    "model_queue_depth",
+    "Model calls waiting for a scheduler slot.",
+    "gauge",
+    lambda: [
+        ({"provider": provider.value, "model": model_name}, scheduler.queued)
+        for (provider, model_name), scheduler in _schedulers.items()
+    ],
+)
+metrics.Observed(
+    "model_calls_active",
+    "Model calls currently running.",
+    "gauge",
+    lambda: [
+        ({"provider": provider.value, "model": model_name}, scheduler.active)
+        for (provider, model_name), scheduler in _schedulers.items()
+    ],
+)
+metrics.Observed(
+    "model_scheduler_events_total",
+    "Model calls queued and rejected by the scheduler.",
+    "counter",
+    lambda: [
+        ({"provider": provider.value, "model": model_name, "event": event}, count)
+        for (provider, model_name), scheduler in _schedulers.items()
+        for event, count in scheduler.stats.items()
+    ],
+)
+
+
+def _get_scheduler(provider: ModelProvider, model_name: str) -> ProviderScheduler:
+    key = (provider, model_name)
+    scheduler = _schedulers.get(key)
+    if scheduler is None:
+        scheduler = _schedulers[key] = ProviderScheduler.from_env(
+            PROVIDER_CONCURRENCY.get(provider, 8)
+        )
+    return scheduler
+
+
+def _status_code(error: Exception) -> int | None:
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+    return status_code
+
+
+def _is_rate_limited(error: Exception) -> bool:
+    return _status_code(error) == 429
+
+
+def _is_transient(error: Exception) -> bool:
+    """Rate limits, server errors, timeouts and dropped connections are worth another try."""
+    status_code = _status_code(error)
+    if status_code is not None:
+        return status_code == 429 or status_code >= 500
+    if isinstance(error, httpx.TransportError):
+        return True
+    try:
+        from openai import APIConnectionError
+    except ImportError:
+        return False
+    # timeouts are connection errors too
+    return isinstance(error, APIConnectionError)
+
+
+async def _call_model(
+    call: Callable[[], Awaitable],
+    scheduler: ProviderScheduler,
+    priority: Priority,
+    tokens: int,
+    on_queued: Callable[[int], Awaitable] | None = None,
+):
+    """
+    Runs a model call in a scheduler slot, retrying rate limited and other
+    transient failures with jittered backoff. The SDK's own retries are off, so
+    a retry waits for a slot again instead of holding one.
+    """
+    for attempt in itertools.count():
+        wait_start = time.perf_counter()
+        await scheduler.acquire(priority, tokens, on_queued)
+        metrics.model_queue_seconds.observe(
+            time.perf_counter() - wait_start, priority=priority.name.lower()
+        )
+        used = 0
+        try:
+            result = await call()
+            response = result[0] if isinstance(result, tuple) else result
+            if response.usage_metadata:
+                used = response.usage_metadata["total_tokens"]
+            return result
+        except Exception as e:
+            if attempt >= RATE_LIMIT_RETRIES or not _is_transient(e):
+                raise
+            delay = RATE_LIMIT_BACKOFF * 2**attempt * random.uniform(0.5, 1.5)
+            if _is_rate_limited(e):
+                print(f"Rate limited, retrying in {delay:.1f}s")
+                metrics.model_rate_limited.inc()
+            else:
+                print(f"Model call failed ({e!r}), retrying in {delay:.1f}s")
+        finally:
+            scheduler.release(tokens, used)
+        await asyncio.sleep(delay)
+
+
 async def _invoke_model(
     model: Runnable,
     prompt_template: Runnable,
@@ -46,7 +272,110 @@ async def _invoke_model(
         input = {}
     chain = prompt_template | model
     print("Invoking model with input:", input)
-    return await chain.ainvoke(input)
+    response = await chain.ainvoke(input)
+    if response.usage_metadata:
+        print("Prompt tokens:", response.usage_metadata["input_tokens"])
+    return response
+
+
+async def _stream_model(
+    model: Runnable,
+    prompt_template: Runnable,
+    toolbelt: Toolbelt,
+    input: dict[str, str] | None = None,
+) -> tuple[AIMessage, list[asyncio.Task]]:
+    """
+    Streams the response, forwarding message text and starting each tool call as
+    soon as it is complete. The tool calls are left running for the caller, so
+    they do not hold the scheduler slot of the stream.
+    """
+    if input is None:
+        input = {}
+    chain = prompt_template | model
+    print("Streaming model with input:", input)
+    board = toolbelt.board
+    response = None
+    tasks = []
+    streamed_text = {}
+    try:
+        async for chunk in chain.astream(input):
+            response = chunk if response is None else response + chunk
+            tool_calls = response.tool_calls
+            # a tool call is complete once the next one has started
+            for tool_call in tool_calls[len(tasks) : -1]:
+                tasks.append(toolbelt.submit(tool_call))
+            for tool_call in tool_calls[len(tasks) :]:
+                if tool_call["name"] != "send_message":
+                    continue
+                text = tool_call["args"].get("message") or ""
+                sent = streamed_text.get(tool_call["id"], 0)
+                if len(text) > sent:
+                    streamed_text[tool_call["id"]] = len(text)
+                    await board.websocket.send(
+                        DTO(
+                            id=board.id,
+                            action="CHAT_PARTIAL",
+                            text=text[sent:],
+                        )
+                    )
+        for tool_call in response.tool_calls[len(tasks) :]:
+            tasks.append(toolbelt.submit(tool_call))
+    except BaseException as e:
+        for task in tasks:
+            task.cancel()
+        if tasks and _is_transient(e):
+            # some tools may have run already, retrying would run them again
+            raise RuntimeError("Model call failed after tool calls started") from e
+        raise
+    response = message_chunk_to_message(response)
+    if response.usage_metadata:
+        print("Prompt tokens:", response.usage_metadata["input_tokens"])
+    return response, tasks
+
+
+async def _summarize(
+    model_provider: ModelProvider,
+    model_name: str,
+    priority: Priority,
+    previous_summary: str,
+    messages: list[BaseMessage],
+) -> str:
+    model = _get_chat_model(model_provider, model_name)
+    prompt = [SystemMessage(SUMMARY_MESSAGE)]
+    if previous_summary:
+        prompt.append(HumanMessage(previous_summary))
+    prompt = [*prompt, *messages, HumanMessage(SUMMARY_REQUEST)]
+    response = await _call_model(
+        partial(model.ainvoke, prompt),
+        _get_scheduler(model_provider, model_name),
+        priority,
+        count_tokens_approximately(prompt),
+    )
+    return f"Summary of the earlier conversation:\n{response.text}"
+
+
+async def _compact_history(
+    board: Board,
+    model_provider: ModelProvider,
+    model_name: str,
+    budget: TurnBudget,
+    priority: Priority,
+):
+    summary_model = os.getenv("HISTORY_SUMMARY_MODEL")
+    try:
+        async with asyncio.timeout(budget.remaining()):
+            await compact_history(
+                board.message_history,
+                get_token_budget(model_name),
+                (
+                    partial(_summarize, model_provider, summary_model, priority)
+                    if summary_model
+                    else None
+                ),
+            )
+    except Exception as e:
+        # the history is only replaced once the summary is ready, the turn goes on without it
+        print("History compaction failed:", repr(e))
 
 
 async def _invoke_agent(
@@ -56,24 +385,138 @@ async def _invoke_agent(
     message_history: list[BaseMessage],
     template_type: TemplateType | None = None,
     input: dict[str, str] | None = None,
+    stream: bool = False,
+    budget: TurnBudget | None = None,
+    priority: Priority | None = None,
 ):
+    if budget is None:
+        budget = TurnBudget()
+    if priority is None:
+        priority = Priority.MOVE if template_type else Priority.CHAT
     model = _get_model(model_provider, model_name, tools=toolbelt.get_tools())
+    scheduler = _get_scheduler(model_provider, model_name)
     if template_type:
-        message_history = await get_example(template_type) + message_history
+        message_history = [
+            *await get_example(template_type, toolbelt.encoding),
+            *message_history,
+        ]
     prompt_template = get_template(message_history, template_type)
 
-    while True:
-        response = await _invoke_model(
+    kind = "move" if template_type else "chat"
+    metrics.turns.inc(kind=kind)
+    start = time.perf_counter()
+    with metrics.span("agent_turn") as turn_span:
+        turn_span.set("board_id", toolbelt.board.id)
+        turn_span.set("kind", kind)
+        await _agent_loop(
             model,
+            model_name,
+            toolbelt,
             prompt_template,
             input,
+            stream,
+            budget,
+            scheduler,
+            priority,
+            move_turn=template_type is not None,
         )
+        turn_span.set("rounds", budget.rounds)
+        if budget.exceeded:
+            turn_span.set("budget_exceeded", budget.exceeded)
+    metrics.turn_seconds.observe(time.perf_counter() - start, kind=kind)
+    metrics.turn_rounds.observe(budget.rounds, kind=kind)
+    if budget.exceeded:
+        metrics.budget_exceeded.inc(kind=kind, limit=budget.exceeded)
+
+
+async def _agent_loop(
+    model: Runnable,
+    model_name: str,
+    toolbelt: Toolbelt,
+    prompt_template: ChatPromptTemplate,
+    input: dict[str, str] | None,
+    stream: bool,
+    budget: TurnBudget,
+    scheduler: ProviderScheduler,
+    priority: Priority,
+    move_turn: bool = False,
+):
+    turn_start = len(prompt_template.messages)
+    board = toolbelt.board
+    ply = len(board.move_stack)
+    prompt_tokens = 0
+    asked_to_commit = False
+
+    async def report_queue(position):
+        await board.websocket.send(DTO(id=board.id, action="QUEUE", text=str(position)))
+
+    while True:
+        budget.exceeded = budget.exhausted()
+        if budget.exceeded:
+            print("Turn budget exceeded:", budget.exceeded)
+            return
+        if (
+            move_turn
+            and not asked_to_commit
+            and len(board.move_stack) == ply
+            and budget.running_low()
+        ):
+            prompt_template.messages.append(HumanMessage(COMMIT_MOVE_REQUEST))
+            asked_to_commit = True
+        with metrics.span("model_call") as model_span:
+            model_span.set("model", model_name)
+            call_start = time.perf_counter()
+            if stream:
+                call = partial(_stream_model, model, prompt_template, toolbelt, input)
+            else:
+                call = partial(_invoke_model, model, prompt_template, input)
+            estimated_tokens = count_tokens_approximately(
+                prompt_template.invoke(input or {}).to_messages()
+            )
+            try:
+                async with asyncio.timeout(budget.remaining()):
+                    response = await _call_model(
+                        call, scheduler, priority, estimated_tokens, report_queue
+                    )
+            except QueueFullError:
+                await report_queue("full")
+                raise
+            except TimeoutError:
+                budget.spend(0)
+                budget.exceeded = "deadline"
+                print("Turn budget exceeded:", budget.exceeded)
+                return
+            if stream:
+                response, tool_tasks = response
+            else:
+                tool_tasks = None
+            metrics.model_seconds.observe(
+                time.perf_counter() - call_start, model=model_name
+            )
+            tokens = 0
+            if response.usage_metadata:
+                usage = response.usage_metadata
+                model_span.set("input_tokens", usage["input_tokens"])
+                model_span.set("output_tokens", usage["output_tokens"])
+                metrics.model_tokens.inc(
+                    usage["input_tokens"], model=model_name, direction="input"
+                )
+                metrics.model_tokens.inc(
+                    usage["output_tokens"], model=model_name, direction="output"
+                )
+                prompt_tokens += usage["input_tokens"]
+                tokens = usage["total_tokens"]
+            budget.spend(tokens)
+        if tool_tasks is None:
+            tool_responses = await toolbelt.run(response.tool_calls)
+        else:
+            tool_responses = await asyncio.gather(*tool_tasks)
         prompt_template.messages.append(response)
         if response.tool_calls:
-            for tool_call in response.tool_calls:
-                tool_response = await toolbelt(tool_call)
-                prompt_template.messages.append(tool_response)
-            if tool_response.name == "stop_interaction":
+            prompt_template.messages.extend(tool_responses)
+            drop_stale_tool_outputs(prompt_template.messages, turn_start)
+            if tool_responses[-1].name == "stop_interaction":
+                print("Prompt tokens in turn:", prompt_tokens)
                 return
         else:
             prompt_template.messages.append(
@@ -88,19 +531,97 @@ async def llm_move(
     model_provider: ModelProvider,
     model_name: str = "llama3.2",
     template_type: TemplateType = TemplateType.STATE,
-):
-    toolbelt = Toolbelt(board)
+    decision_cache: DecisionCache | None = None,
+    opening_book: OpeningBook | None = None,
+    stream: bool = False,
+    budget: TurnBudget | None = None,
+    priority: Priority = Priority.MOVE,
+) -> TurnReport:
+    if budget is None:
+        budget = TurnBudget()
+    budget.start()
+    toolbelt = Toolbelt(
+        board,
+        report_progress=stream,
+        encoding=get_encoding(model_name, template_type),
+    )
     side_to_move = get_color_name(board.turn)
     input = {"side_to_move": side_to_move}
 
-    await _invoke_agent(
-        model_provider,
-        model_name,
-        toolbelt,
-        board.message_history,
-        template_type,
-        input,
+    if opening_book is not None:
+        move = opening_book.choose(board)
+        if move is not None:
+            print("Playing book move:", move)
+            if opening_book.announce:
+                await toolbelt["send_message"].ainvoke(
+                    {"message": f"{board.san(move)} is a well-known opening move."}
+                )
+            await toolbelt["make_move"].ainvoke({"move": move.uci()})
+            return TurnReport(source="book")
+
+    if decision_cache is not None:
+        cache_key = decision_cache.key(board, model_name, template_type)
+        decision = decision_cache.get(cache_key, board)
+        if decision is not None:
+            print("Replaying cached decision:", decision)
+            for message in decision.messages:
+                await toolbelt["send_message"].ainvoke({"message": message})
+            await toolbelt["make_move"].ainvoke({"move": decision.move})
+            return TurnReport(source="cache")
+
+    ply = len(board.move_stack)
+
+    try:
+        await _compact_history(board, model_provider, model_name, budget, priority)
+        history_length = len(board.message_history)
+        await _invoke_agent(
+            model_provider,
+            model_name,
+            toolbelt,
+            board.message_history,
+            template_type,
+            input,
+            stream,
+            budget,
+            priority,
+        )
+    except Exception as e:
+        print("Agent turn failed:", e)
+        budget.exceeded = "busy" if isinstance(e, QueueFullError) else "error"
+
+    report = TurnReport(
+        source="agent",
+        rounds=budget.rounds,
+        tokens=budget.tokens,
+        illegal_moves=toolbelt.illegal_moves,
+        exceeded=budget.exceeded,
     )
+    if len(board.move_stack) == ply:
+        if board.is_game_over():
+            # nothing left to play, and nothing to report to the client
+            return report
+        # every move request ends with a move, whatever happened to the agent
+        reason = budget.exceeded or "no_move"
+        move = await _fallback_move(toolbelt, budget)
+        await _report_budget(board, reason, move)
+        report.source = "fallback"
+        return report
+    if budget.exceeded:
+        await _report_budget(board, budget.exceeded)
+
+    if decision_cache is not None and len(board.move_stack) == ply + 1:
+        decision_cache.put(
+            cache_key,
+            CachedDecision(
+                move=board.peek().uci(),
+                messages=[
+                    m.content
+                    for m in board.message_history[history_length:]
+                    if isinstance(m, AIMessage)
+                ],
+            ),
+        )
+    return report
 
 
 async def llm_message(
@@ -108,13 +629,48 @@ async def llm_message(
     user_message: str,
     model_provider: ModelProvider,
     model_name: str = "llama3.2",
+    stream: bool = False,
+    budget: TurnBudget | None = None,
 ):
-    toolbelt = Toolbelt(board)
+    if budget is None:
+        budget = TurnBudget()
+    budget.start()
+    toolbelt = Toolbelt(
+        board, report_progress=stream, encoding=get_encoding(model_name)
+    )
     board.message_history.append(HumanMessage(content=user_message))
+    await _compact_history(board, model_provider, model_name, budget, Priority.CHAT)
 
     await _invoke_agent(
         model_provider,
         model_name,
         toolbelt,
         board.message_history,
+        stream=stream,
+        budget=budget,
+    )
+    if budget.exceeded:
+        await _report_budget(board, budget.exceeded)
+
+
+async def _fallback_move(toolbelt: Toolbelt, budget: TurnBudget) -> Move | None:
+    board = toolbelt.board
+    if board.is_game_over():
+        return None
+    match budget.fallback:
+        case FallbackPolicy.ENGINE:
+            searcher = Searcher(time_limit=budget.fallback_time_limit)
+            move = await asyncio.to_thread(searcher.best_move, board.copy())
+        case FallbackPolicy.RANDOM:
+            move = random.choice(list(board.legal_moves))
+        case _:
+            raise ValueError(f"Unsupported fallback policy: {budget.fallback}")
+    print("Playing fallback move:", move)
+    await toolbelt["make_move"].ainvoke({"move": move.uci()})
+    return Move.from_uci(move.uci())
+
+
+async def _report_budget(board: Board, reason: str, move: Move | None = None):
+    await board.websocket.send(
+        DTO(id=board.id, action="BUDGET", move=move, text=reason)
     )
@@ -1,10 +1,22 @@
+import asyncio
+import time
+
 from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolCall
 from langchain_core.tools import BaseTool, tool
 
 import chess
 
+from .. import metrics
 from ..api import DTO, Move
 from ..chess import Board
+from ..chess.engine import Searcher, format_score
+from .encoding import (
+    PositionEncoding,
+    compact_attackers,
+    compact_position,
+    compact_square_info,
+    compact_squares,
+)
 from .utils import get_color_name
 
 
@@ -12,27 +24,93 @@ class InteractionFinishedException(Exception):
     pass
 
 
+ENGINE_TIME_LIMIT = 1.0
+
+READ_ONLY_TOOLS = {
+    "get_position",
+    "get_moves",
+    "get_square_info",
+    "analyse_move",
+    "marked_squares",
+    "evaluate_candidates",
+}
+
+
 class Toolbelt:
-    def __init__(self, board: Board):
+    def __init__(
+        self,
+        board: Board,
+        report_progress: bool = False,
+        encoding: PositionEncoding = PositionEncoding.VERBOSE,
+    ):
+        self.board = board
+        self.report_progress = report_progress
+        self.encoding = encoding
         self.tools = {
             "make_move": make_move_tool_factory(board),
-            "get_position": get_position_tool_factory(board),
+            "get_position": get_position_tool_factory(board, encoding),
             "get_moves": get_moves_tool_factory(board),
-            "get_square_info": get_square_info_tool_factory(board),
-            "analyse_move": analyse_move_tool_factory(board),
+            "get_square_info": get_square_info_tool_factory(board, encoding),
+            "analyse_move": analyse_move_tool_factory(board, encoding),
+            "evaluate_candidates": evaluate_candidates_tool_factory(board),
             "send_message": send_message_tool_factory(board),
             "mark_square": mark_square_tool_factory(board),
             "marked_squares": marked_squares_tool_factory(board),
             "stop_interaction": stop_interaction,
         }
+        self.illegal_moves = 0
+        self._last_write: asyncio.Task | None = None
+        self._reads: list[asyncio.Task] = []
 
     async def __call__(self, tool_call: ToolCall) -> BaseMessage:
         print("Tool call:", tool_call)
         tool = self[tool_call["name"]]
-        tool_response = await tool.ainvoke(tool_call)
+        if self.report_progress and tool_call["name"] in READ_ONLY_TOOLS:
+            await self.board.websocket.send(
+                DTO(
+                    id=self.board.id,
+                    action="TOOL",
+                    text=tool_call["name"],
+                )
+            )
+        with metrics.span("tool_call") as tool_span:
+            tool_span.set("tool", tool_call["name"])
+            start = time.perf_counter()
+            tool_response = await tool.ainvoke(tool_call)
+            metrics.tool_seconds.observe(
+                time.perf_counter() - start, tool=tool_call["name"]
+            )
+        if tool_call["name"] == "make_move" and "Could not" in tool_response.content:
+            self.illegal_moves += 1
         print("Tool response:", tool_response.content)
         return tool_response
 
+    def submit(self, tool_call: ToolCall) -> asyncio.Task:
+        """
+        Schedule a tool call. Read-only tools run concurrently with each other,
+        every other tool waits for all the calls submitted before it.
+        """
+        waits = [self._last_write] if self._last_write else []
+        if tool_call["name"] in READ_ONLY_TOOLS:
+            task = asyncio.create_task(self._run_after(tool_call, waits))
+            self._reads.append(task)
+        else:
+            waits.extend(self._reads)
+            task = asyncio.create_task(self._run_after(tool_call, waits))
+            self._last_write = task
+            self._reads = []
+        return task
+
+    async def run(self, tool_calls: list[ToolCall]) -> list[BaseMessage]:
+        return await asyncio.gather(*map(self.submit, tool_calls))
+
+    async def _run_after(
+        self, tool_call: ToolCall, waits: list[asyncio.Task]
+    ) -> BaseMessage:
+        if waits:
+            await asyncio.wait(waits)
+        return await self(tool_call)
+
     def get_tools(self) -> list[BaseTool]:
         return list(self.tools.values())
 
@@ -59,7 +137,7 @@ def make_move_tool_factory(board: Board) -> BaseTool:
                 id=board.id,
                 action="MOVE",
                 move=Move.from_uci(parsed_move.uci()),
-            ).model_dump_json()
+            )
         )
         return f"Move made: {parsed_move.uci()}"
 
@@ -81,7 +159,7 @@ def send_message_tool_factory(board: Board) -> BaseTool:
                 id=board.id,
                 action="CHAT",
                 text=message,
-            ).model_dump_json()
+            )
         )
         board.message_history.append(AIMessage(content=message))
         return f"Message sent."
@@ -89,7 +167,9 @@ def send_message_tool_factory(board: Board) -> BaseTool:
     return send_message
 
 
-def get_position_tool_factory(board: Board) -> BaseTool:
+def get_position_tool_factory(
+    board: Board, encoding: PositionEncoding = PositionEncoding.VERBOSE
+) -> BaseTool:
 
     @tool
     def get_position() -> str:
@@ -99,6 +179,12 @@ def get_position_tool_factory(board: Board) -> BaseTool:
         if _is_starting_position(board):
             return "The chessboard is in the starting position."
 
+        if encoding == PositionEncoding.COMPACT:
+            result = compact_position(board)
+            if 0 < len(board.move_stack) < 20:
+                result += f"\nMoves: {board.san_history()}"
+            return result
+
         result = f"""Here is the current state of the chess game:
     
         {_get_piece_map(board)}
@@ -107,7 +193,7 @@ def get_position_tool_factory(board: Board) -> BaseTool:
 
         move_history = board.move_stack
         if 0 < len(move_history) < 20:
-            result += f"Move history: {chess.Board(fen=board.fen0).variation_san(board.move_stack)}\n"
+            result += f"Move history: {board.san_history()}\n"
 
         result += f"It is {get_color_name(board.turn)}'s turn. {_is_check(board)}"
 
@@ -128,12 +214,14 @@ def get_moves_tool_factory(board: Board) -> BaseTool:
             if _is_starting_position(board):
                 return "No moves have been made yet."
             return "The move history is unavailable, but the game is not in the starting position."
-        return "Moves made: " + chess.Board().variation_san(board.move_stack)
+        return "Moves made: " + board.san_history()
 
     return get_moves
 
 
-def get_square_info_tool_factory(board: Board) -> BaseTool:
+def get_square_info_tool_factory(
+    board: Board, encoding: PositionEncoding = PositionEncoding.VERBOSE
+) -> BaseTool:
 
     @tool
     def get_square_info(square_name: str) -> str:
@@ -144,6 +232,8 @@ def get_square_info_tool_factory(board: Board) -> BaseTool:
             square_name (str): The name of the square (e.g., e4, f6).
         """
         square = chess.parse_square(square_name)
+        if encoding == PositionEncoding.COMPACT:
+            return compact_square_info(board, square)
         return "\n".join(
             [
                 _get_piece_info_on_square(board, square),
@@ -155,7 +245,9 @@ def get_square_info_tool_factory(board: Board) -> BaseTool:
     return get_square_info
 
 
-def analyse_move_tool_factory(board: Board) -> BaseTool:
+def analyse_move_tool_factory(
+    source_board: Board, encoding: PositionEncoding = PositionEncoding.VERBOSE
+) -> BaseTool:
 
     @tool
     def analyse_move(move: str) -> str:
@@ -165,12 +257,17 @@ def analyse_move_tool_factory(board: Board) -> BaseTool:
         Args:
             move (str): The move to analyse. It should be in algebraic notation (e.g., e5 or Nf6).
         """
+        analysis = source_board.analysis()
         try:
-            parsed_move = board.parse_san(move.strip())
-            if not board.is_legal(parsed_move):
+            parsed_move = source_board.parse_san(move.strip())
+            if parsed_move not in analysis.moves_from(parsed_move.from_square):
                 raise chess.IllegalMoveError("Illegal move")
         except Exception:
             return f"The move {move} is illegal."
+        # the move is played on a copy, so other tools can read the board in parallel
+        board = source_board.copy(stack=False)
+        if encoding == PositionEncoding.COMPACT:
+            return _compact_move_analysis(board, parsed_move)
         result = f"The move {board.lan(parsed_move)} is legal."
 
         if board.gives_check(parsed_move):
@@ -200,6 +297,33 @@ def analyse_move_tool_factory(board: Board) -> BaseTool:
     return analyse_move
 
 
+def evaluate_candidates_tool_factory(board: Board) -> BaseTool:
+
+    @tool
+    def evaluate_candidates(count: int = 5) -> str:
+        """
+        Evaluate the position with a chess engine and get the best candidate moves with their scores.
+
+        Args:
+            count (int): The number of candidate moves to return.
+        """
+        searcher = Searcher(time_limit=ENGINE_TIME_LIMIT)
+        candidates = searcher.search(board, max(1, count))
+        if not candidates:
+            return "There are no legal moves."
+        return (
+            f"Best moves for {get_color_name(board.turn)} (search depth {searcher.depth}):\n"
+            + "\n".join(
+                [
+                    f"{i}. {board.san(move)} ({format_score(score)})"
+                    for i, (move, score) in enumerate(candidates, 1)
+                ]
+            )
+        )
+
+    return evaluate_candidates
+
+
 def mark_square_tool_factory(board: Board) -> BaseTool:
 
     @tool
@@ -219,7 +343,7 @@ def mark_square_tool_factory(board: Board) -> BaseTool:
                 id=board.id,
                 action="MARKER",
                 move=Move(source=square, target=square),
-            ).model_dump_json()
+            )
         )
 
     return mark_square
@@ -248,9 +372,10 @@ def stop_interaction() -> str:
 
 
 def _get_piece_map(board: Board) -> str:
+    analysis = board.analysis()
     return "\n".join(
         [
-            f"{chess.square_name(s)}: {get_color_name(p.color)} {chess.piece_name(p.piece_type)}{" (attacked)" if board.is_attacked_by(not p.color, s) else ""}"
+            f"{chess.square_name(s)}: {get_color_name(p.color)} {chess.piece_name(p.piece_type)}{" (attacked)" if analysis.is_attacked_by(not p.color, s) else ""}"
             for s, p in board.piece_map().items()
             if p
         ]
@@ -263,18 +388,15 @@ def _get_piece_info_on_square(board: Board, square: chess.Square) -> str:
         return f"No piece on {chess.square_name(square)}"
     color = get_color_name(piece.color)
     result = f"There is a {color} {chess.piece_name(piece.piece_type)} on {chess.square_name(square)}."
-    legal_moves = [
-        chess.square_name(m.to_square)
-        for m in board.legal_moves
-        if m.from_square == square
-    ]
+    analysis = board.analysis()
+    legal_moves = [chess.square_name(m.to_square) for m in analysis.moves_from(square)]
     if not legal_moves:
         result += f" It can't move because"
         if board.turn != piece.color:
             result += f" it is not {get_color_name(board.turn)}'s turn."
-        elif board.is_pinned(piece.color, square):
+        elif analysis.is_pinned(piece.color, square):
             result += f" it is pinned."
-        elif board.is_check():
+        elif analysis.checkers:
             result += f" it is a check."
         else:
             result += f" it is blocked."
@@ -287,7 +409,7 @@ def _get_piece_info_on_square(board: Board, square: chess.Square) -> str:
 def _get_attackers(board: Board, square: chess.Square, color: chess.Color) -> str:
     piece = board.piece_at(square)
     title = "attackers" if piece is None or piece.color != color else "defenders"
-    attackers = board.attackers(color, square)
+    attackers = board.analysis().attackers(color, square)
     color_name = get_color_name(color)
     if not attackers:
         return f"No {color_name} {title} for {chess.square_name(square)}"
@@ -300,7 +422,7 @@ def _get_attackers(board: Board, square: chess.Square, color: chess.Color) -> st
 
 
 def _get_checkers(board: Board) -> str:
-    checkers = board.checkers()
+    checkers = board.analysis().checkers
     if not checkers:
         return "No checkers."
     return ", ".join(
@@ -311,8 +433,24 @@ def _get_checkers(board: Board) -> str:
     )
 
 
+def _compact_move_analysis(board: Board, move: chess.Move) -> str:
+    captured_piece = board.piece_at(move.to_square)
+    result = ", ".join(
+        [
+            f"{board.san(move)}: legal",
+            "check" if board.gives_check(move) else "no check",
+            (f"captures {captured_piece.symbol()}" if captured_piece else "no capture"),
+        ]
+    )
+    board.push(move)
+    result += f"\nAttacks: {compact_squares(board.attacks(move.to_square))}\n"
+    result += compact_attackers(board, move.to_square)
+    board.pop()
+    return result
+
+
 def _is_check(board: Board) -> str:
-    if board.is_check():
+    if board.analysis().checkers:
         return "The position is a check. Checkers: " + _get_checkers(board)
     return "The position is not a check."
 
@@ -0,0 +1,385 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import signal
+import statistics
+import subprocess
+import sys
+import time
+
+import aiohttp
+
+import chess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+METRIC_LINE = re.compile(r"^(\w+)(\{.*\})? (\S+)$")
+
+
+class Stats:
+    """What the clients measured during one stage."""
+
+    def __init__(self):
+        self.connect: list[float] = []
+        self.latency: list[float] = []
+        self.requests = 0
+        self.errors = 0
+
+
+class Recorder:
+    def __init__(self):
+        self.current = Stats()
+
+
+class Client:
+    """A simulated player that speaks the websocket protocol of the UI."""
+
+    def __init__(self, url: str, config: dict, recorder: Recorder):
+        self.url = url
+        self.config = config
+        self.recorder = recorder
+        self.board = chess.Board()
+        self.board_id: str | None = None
+        self._echo: str | None = None
+        self._reply: asyncio.Future | None = None
+
+    async def run(self, session: aiohttp.ClientSession, stop: asyncio.Event):
+        start = time.perf_counter()
+        try:
+            websocket = await session.ws_connect(self.url)
+        except aiohttp.ClientError:
+            self.recorder.current.errors += 1
+            return
+        try:
+            start_message = await websocket.receive_json(timeout=self.config["timeout"])
+            self.board_id = start_message["id"]
+            self.recorder.current.connect.append(time.perf_counter() - start)
+            reader = asyncio.create_task(self._read(websocket))
+            try:
+                while not stop.is_set() and not reader.done():
+                    await self._step(websocket)
+            finally:
+                reader.cancel()
+        except (aiohttp.ClientError, asyncio.TimeoutError, ConnectionResetError):
+            self.recorder.current.errors += 1
+        finally:
+            await websocket.close()
+
+    async def _step(self, websocket: aiohttp.ClientWebSocketResponse):
+        config = self.config
+        await asyncio.sleep(random.uniform(*config["think"]))
+        if (
+            self.board.is_game_over()
+            or len(self.board.move_stack) >= config["max_plies"]
+        ):
+            self.board.reset()
+            await self._send(websocket, "SETUP", fen=self.board.fen())
+        elif random.random() < config["chat_rate"]:
+            await self._send(
+                websocket, "CHAT", text="What do you think of this position?"
+            )
+        elif random.random() < config["marker_rate"]:
+            square = chess.square_name(random.choice(chess.SQUARES))
+            await self._send(
+                websocket, "MARKER", move={"source": square, "target": square}
+            )
+        elif random.random() < config["undo_rate"] and len(self.board.move_stack) >= 2:
+            await self._request(websocket, "UNDO", text="2")
+        else:
+            move = random.choice(list(self.board.legal_moves))
+            self.board.push(move)
+            self._echo = move.uci()
+            await self._request(
+                websocket,
+                "MOVE",
+                # the agent does not answer once the game is over
+                wait=not self.board.is_game_over(),
+                move={
+                    "source": chess.square_name(move.from_square),
+                    "target": chess.square_name(move.to_square),
+                    "promotion": (
+                        chess.piece_symbol(move.promotion) if move.promotion else None
+                    ),
+                },
+            )
+
+    async def _request(self, websocket, action: str, wait: bool = True, **fields):
+        stats = self.recorder.current
+        stats.requests += 1
+        self._reply = asyncio.get_running_loop().create_future()
+        start = time.perf_counter()
+        await self._send(websocket, action, **fields)
+        if not wait:
+            return
+        try:
+            ok = await asyncio.wait_for(self._reply, self.config["timeout"])
+        except asyncio.TimeoutError:
+            ok = False
+        if ok:
+            stats.latency.append(time.perf_counter() - start)
+        else:
+            stats.errors += 1
+
+    async def _send(self, websocket, action: str, **fields):
+        await websocket.send_str(
+            json.dumps({"id": self.board_id, "action": action, **fields})
+        )
+
+    async def _read(self, websocket: aiohttp.ClientWebSocketResponse):
+        async for message in websocket:
+            if message.type != aiohttp.WSMsgType.TEXT:
+                continue
+            dto = json.loads(message.data)
+            action = dto["action"]
+            if action == "MOVE":
+                uci = (
+                    dto["move"]["source"]
+                    + dto["move"]["target"]
+                    + (dto["move"]["promotion"] or "")
+                )
+                if uci == self._echo:
+                    self._echo = None
+                    continue
+                self.board.push_uci(uci)
+                self._resolve(True)
+            elif action == "UNDO":
+                self.board.set_fen(dto["fen"])
+                self._resolve(True)
+            elif action == "ERROR":
+                if dto.get("fen"):
+                    self.board.set_fen(dto["fen"])
+                self._resolve(False)
+
+    def _resolve(self, ok: bool):
+        if self._reply is not None and not self._reply.done():
+            self._reply.set_result(ok)
+
+
+async def run_stages(config: dict) -> list[dict]:
+    """Adds clients stage by stage and measures each stage once they are all running."""
+    recorder = Recorder()
+    stop = asyncio.Event()
+    tasks = []
+    stages = []
+    client_lag: list[float] = []
+    lag_monitor = asyncio.create_task(_monitor_lag(client_lag))
+    async with aiohttp.ClientSession() as session:
+        for count in config["stages"]:
+            recorder.current = stats = Stats()
+            client_lag.clear()
+            before = await _scrape(session, config["server"])
+            new = count - len(tasks)
+            for _ in range(new):
+                client = Client(f"{_ws_url(config['server'])}/ws", config, recorder)
+                tasks.append(asyncio.create_task(client.run(session, stop)))
+                # connections are spread over the first second of the stage
+                await asyncio.sleep(1 / new)
+            await asyncio.sleep(max(0.0, config["duration"] - 1))
+            after = await _scrape(session, config["server"])
+            stage = _summarize(count, stats, before, after, config["duration"])
+            stage["client_loop_lag_max"] = max(client_lag, default=0.0)
+            stages.append(stage)
+            print(_format_stage(stage), file=sys.stderr)
+        stop.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    lag_monitor.cancel()
+    return stages
+
+
+async def _monitor_lag(lags: list[float], interval: float = 0.1):
+    # a harness that cannot keep up inflates the latencies it reports
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - start - interval)
+
+
+async def _scrape(session: aiohttp.ClientSession, server: str) -> dict[str, float]:
+    try:
+        async with session.get(f"{server}/metrics") as response:
+            text = await response.text()
+    except aiohttp.ClientError:
+        return {}
+    samples = {}
+    for line in text.splitlines():
+        match = METRIC_LINE.match(line)
+        if match:
+            name, labels, value = match.groups()
+            samples[name + (labels or "")] = float(value)
+    return samples
+
+
+def _summarize(
+    clients: int, stats: Stats, before: dict, after: dict, duration: float
+) -> dict:
+    latency = sorted(stats.latency)
+    connect = sorted(stats.connect)
+    lag_count = after.get("event_loop_lag_seconds_count", 0) - before.get(
+        "event_loop_lag_seconds_count", 0
+    )
+    lag_sum = after.get("event_loop_lag_seconds_sum", 0) - before.get(
+        "event_loop_lag_seconds_sum", 0
+    )
+    return {
+        "clients": clients,
+        "requests": stats.requests,
+        "requests_per_second": stats.requests / duration,
+        "errors": stats.errors,
+        "error_rate": stats.errors / stats.requests if stats.requests else None,
+        "connect_p50": _percentile(connect, 50),
+        "connect_p99": _percentile(connect, 99),
+        "latency_p50": _percentile(latency, 50),
+        "latency_p90": _percentile(latency, 90),
+        "latency_p99": _percentile(latency, 99),
+        "latency_mean": statistics.fmean(latency) if latency else None,
+        "server_rss_bytes": after.get("process_resident_memory_bytes"),
+        "server_loop_lag_mean": lag_sum / lag_count if lag_count else None,
+        "server_loop_lag_p99": _bucket_percentile(before, after, 99),
+    }
+
+
+def _bucket_percentile(before: dict, after: dict, percentile: float) -> float | None:
+    """The upper bound of the lag bucket the percentile of the stage falls in."""
+    prefix = "event_loop_lag_seconds_bucket"
+    buckets = []
+    for key, value in after.items():
+        if key.startswith(prefix):
+            bound = key.split('le="')[1].rstrip('"}')
+            buckets.append((float(bound), value - before.get(key, 0)))
+    buckets.sort()
+    if not buckets or not buckets[-1][1]:
+        return None
+    for bound, count in buckets:
+        if count >= buckets[-1][1] * percentile / 100:
+            return bound
+    return None
+
+
+def _ws_url(server: str) -> str:
+    return server.replace("http://", "ws://", 1).replace("https://", "wss://", 1)
+
+
+def _format_stage(stage: dict) -> str:
+    return (
+        f"{stage['clients']:>5} clients: {stage['requests_per_second']:.1f} req/s, "
+        f"latency p50 {_format(stage['latency_p50'])} p99 {_format(stage['latency_p99'])}, "
+        f"errors {stage['errors']}, "
+        f"server rss {_format((stage['server_rss_bytes'] or 0) / 2**20)} MiB, "
+        f"loop lag mean {_format(stage['server_loop_lag_mean'])}"
+    )
+
+
+def _format(value) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.3f}"
+    return str(value)
+
+
+def _percentile(values: list[float], percentile: float) -> float | None:
+    if not values:
+        return None
+    index = min(len(values) - 1, round(percentile / 100 * (len(values) - 1)))
+    return values[index]
+
+
+def start_server(port: int, latency: float, log_path: str | None) -> subprocess.Popen:
+    """Starts a server on the fake model, without a store so runs do not leave games behind."""
+    env = {
+        **os.environ,
+        "PORT": str(port),
+        "MODEL_PROVIDER": "fake",
+        "FAKE_MODEL_LATENCY": str(latency),
+        "GAMES_STORE_PATH": "",
+        "TURN_FALLBACK": "random",
+    }
+    log = open(log_path, "w") if log_path else subprocess.DEVNULL
+    return subprocess.Popen(
+        [sys.executable, "start.py"], cwd=ROOT, env=env, stdout=log, stderr=log
+    )
+
+
+async def wait_for_server(server: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get(f"{server}/metrics") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"The server at {server} did not start")
+            await asyncio.sleep(0.2)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Load test the websocket server with simulated players."
+    )
+    parser.add_argument(
+        "-c", "--clients", default="1,10,50,100", help="clients in each stage"
+    )
+    parser.add_argument(
+        "-d", "--duration", type=float, default=30, help="seconds per stage"
+    )
+    parser.add_argument(
+        "--think", default="1-3", help="seconds between actions, e.g. 1-3"
+    )
+    parser.add_argument("--chat-rate", type=float, default=0.05)
+    parser.add_argument("--marker-rate", type=float, default=0.1)
+    parser.add_argument("--undo-rate", type=float, default=0.02)
+    parser.add_argument("--max-plies", type=int, default=80)
+    parser.add_argument(
+        "--timeout", type=float, default=60, help="seconds to wait for a reply"
+    )
+    parser.add_argument(
+        "--server", help="an already running server, e.g. http://localhost:8080"
+    )
+    parser.add_argument(
+        "--port", type=int, default=8090, help="port of the started server"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.5, help="fake model latency in seconds"
+    )
+    parser.add_argument("--server-log", help="where the started server logs")
+    parser.add_argument("--report", help="write the stages as JSON")
+    args = parser.parse_args(argv)
+
+    think_min, _, think_max = args.think.partition("-")
+    config = {
+        "stages": [int(count) for count in args.clients.split(",")],
+        "duration": args.duration,
+        "think": (float(think_min), float(think_max or think_min)),
+        "chat_rate": args.chat_rate,
+        "marker_rate": args.marker_rate,
+        "undo_rate": args.undo_rate,
+        "max_plies": args.max_plies,
+        "timeout": args.timeout,
+        "server": args.server or f"http://localhost:{args.port}",
+    }
+    process = None
+    if args.server is None:
+        process = start_server(args.port, args.latency, args.server_log)
+    try:
+        asyncio.run(wait_for_server(config["server"]))
+        stages = asyncio.run(run_stages(config))
+    finally:
+        if process is not None:
+            process.send_signal(signal.SIGTERM)
+            process.wait()
+
+    report = {
+        "config": {**config, "latency": args.latency if process else None},
+        "stages": stages,
+    }
+    print(json.dumps(report, indent=2))
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
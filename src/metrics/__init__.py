@@ -0,0 +1,261 @@
+import asyncio
+import json
+import os
+import resource
+import sys
+import time
+import uuid
+from collections import defaultdict
+from collections.abc import Callable, Iterable
+from contextvars import ContextVar
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+Labels = tuple[tuple[str, str], ...]
+
+_metrics: list["Metric"] = []
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        _metrics.append(self)
+
+    def samples(self) -> Iterable[tuple[str, Labels, float]]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str):
+        super().__init__(name, help)
+        self.values: dict[Labels, float] = defaultdict(float)
+
+    def inc(self, amount: float = 1, **labels: str):
+        self.values[tuple(labels.items())] += amount
+
+    def samples(self):
+        for labels, value in self.values.items():
+            yield self.name, labels, value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self, name: str, help: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, help)
+        self.buckets = buckets
+        self.counts: dict[Labels, list[int]] = {}
+        self.sums: dict[Labels, float] = defaultdict(float)
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(labels.items())
+        counts = self.counts.get(key)
+        if counts is None:
+            counts = self.counts[key] = [0] * (len(self.buckets) + 1)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+        self.sums[key] += value
+
+    def samples(self):
+        for labels, counts in self.counts.items():
+            total = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                total += count
+                yield f"{self.name}_bucket", (*labels, ("le", str(bound))), total
+            yield f"{self.name}_sum", labels, self.sums[labels]
+            yield f"{self.name}_count", labels, total
+
+
+class Observed(Metric):
+    """A metric whose samples are read from somewhere else when it is collected."""
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        type: str,
+        collect: Callable[[], Iterable[tuple[dict[str, str], float]]],
+    ):
+        super().__init__(name, help)
+        self.type = type
+        self.collect = collect
+
+    def samples(self):
+        for labels, value in self.collect():
+            yield self.name, tuple(labels.items()), value
+
+
+def render() -> str:
+    """Renders every metric in the Prometheus text format."""
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        for name, labels, value in metric.samples():
+            if labels:
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+                lines.append(f"{name}{{{label_text}}} {value}")
+            else:
+                lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class Span:
+    """Times a unit of work and, with tracing enabled, logs it as a JSON line."""
+
+    __slots__ = (
+        "name",
+        "attributes",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "start",
+        "_token",
+    )
+
+    def __init__(self, name: str):
+        self.name = name
+        self.attributes = {}
+        parent = _current_span.get()
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.span_id = uuid.uuid4().hex[:16]
+
+    def set(self, key: str, value):
+        self.attributes[key] = value
+
+    def __enter__(self) -> "Span":
+        self.start = time.perf_counter()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        _current_span.reset(self._token)
+        record = {
+            "span": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "duration_ms": round((time.perf_counter() - self.start) * 1000, 3),
+            **self.attributes,
+        }
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+        print(json.dumps(record, default=str))
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def set(self, key: str, value):
+        pass
+
+    def __enter__(self) -> "_NoSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+_current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+tracing_enabled = False
+
+
+def enable_tracing(enabled: bool = True):
+    global tracing_enabled
+    tracing_enabled = enabled
+
+
+def span(name: str) -> Span | _NoSpan:
+    if not tracing_enabled:
+        return _NO_SPAN
+    return Span(name)
+
+
+turns = Counter("agent_turns_total", "Agent turns started.")
+turn_seconds = Histogram("agent_turn_seconds", "Duration of agent turns.")
+turn_rounds = Histogram(
+    "agent_turn_rounds",
+    "Model rounds per agent turn.",
+    (1, 2, 3, 4, 5, 6, 8, 10, 15, 20),
+)
+budget_exceeded = Counter(
+    "agent_turn_budget_exceeded_total", "Agent turns stopped by their budget."
+)
+model_seconds = Histogram("model_call_seconds", "Duration of model calls.")
+model_queue_seconds = Histogram(
+    "model_queue_seconds", "Time model calls wait for a scheduler slot."
+)
+model_rate_limited = Counter(
+    "model_rate_limited_total", "Model calls retried after a rate limit response."
+)
+model_tokens = Counter("model_tokens_total", "Tokens used by model calls.")
+cassette_events = Counter(
+    "model_cassette_events_total", "Model responses replayed, recorded and missing."
+)
+ponder_events = Counter(
+    "ponder_events_total",
+    "Speculative turns started, skipped and discarded, and predictions hit or missed.",
+)
+ponder_tokens = Counter(
+    "ponder_tokens_total", "Tokens of speculative turns, used or wasted."
+)
+tool_seconds = Histogram(
+    "tool_call_seconds",
+    "Duration of tool calls.",
+    (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5),
+)
+send_seconds = Histogram(
+    "websocket_send_seconds",
+    "Duration of outbound websocket sends.",
+    (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1),
+)
+outbox_coalesced = Counter(
+    "websocket_coalesced_total", "Outbound messages merged into a queued one."
+)
+outbox_dropped = Counter(
+    "websocket_dropped_total", "Outbound messages dropped for slow clients."
+)
+loop_lag = Histogram(
+    "event_loop_lag_seconds",
+    "How late a periodic timer runs on the event loop.",
+    (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+
+def _resident_memory() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # the peak instead where /proc is not available, reported in bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+Observed(
+    "process_resident_memory_bytes",
+    "Resident memory of the process.",
+    "gauge",
+    lambda: [({}, _resident_memory())],
+)
+
+
+async def monitor_loop_lag(interval: float = 0.25):
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        loop_lag.observe(max(0.0, loop.time() - start - interval))
@@ -1,121 +1,397 @@
 import asyncio
-import uuid
+import json
+import os
+import signal
+from collections.abc import Awaitable, Callable
 
-from aiohttp import web
+from aiohttp import WSCloseCode, WSMsgType, web
 from dotenv import load_dotenv
-from websockets.asyncio.server import serve
 
+from .. import metrics
 from ..api import DTO, Move
+from ..batch import PositionParser, analyse_stream, create_executor, read_lines
 from ..chess import Board
-from ..llm.prompts import TemplateType
-from ..llm.service import ModelProvider, llm_message, llm_move
+from ..chess.book import OpeningBook
+from ..llm.budget import TurnBudget
+from ..llm.cache import DecisionCache
+from ..llm.encoding import PositionEncoding
+from ..llm.example import example_stats, preload_examples
+from ..llm.service import ModelProvider
+from .outbox import Outbox
+from .registry import GameRegistry, GameStore, new_board_id
+from .static import StaticPage
+from .turns import TurnScheduler
+from .workers import WorkerPool
 
 load_dotenv()
 
-games: dict[str, Board] = {}
+MODEL_PROVIDER = ModelProvider(os.getenv("MODEL_PROVIDER", "openai"))
+MODEL_NAME = os.getenv("MODEL_NAME", "gpt-4o-mini")
+MOVE_PROVIDER = os.getenv("MOVE_PROVIDER", "random")
+ENGINE_TIME_LIMIT = float(os.getenv("ENGINE_TIME_LIMIT", "1.0"))
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "0") == "1"
+HOST = os.getenv("HOST", "localhost")
+PORT = int(os.getenv("PORT", "8080"))
+WS_HEARTBEAT = float(os.getenv("WS_HEARTBEAT", "30")) or None
+WS_COMPRESS = os.getenv("WS_COMPRESS", "1") == "1"
+SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", "30"))
+WORKERS = int(os.getenv("WORKERS", "1"))
+WORKER_BASE_PORT = int(os.getenv("WORKER_BASE_PORT", "9000"))
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "0")) or None
+ANALYSIS_WINDOW = int(os.getenv("ANALYSIS_WINDOW", "16"))
 
+decision_cache = DecisionCache.from_env()
+opening_book = OpeningBook.from_env()
+schedulers: dict[str, TurnScheduler] = {}
+connections: set[Outbox] = set()
+index_page = StaticPage(os.path.join(os.path.dirname(__file__), "index.html"))
+# the shard of the games this process owns, set when running as a worker
+shard, shards = 0, 1
+analysis_executor = None
 
-async def websocket_handler(websocket):
-    board_id = str(uuid.uuid4())
-    board = Board(board_id, websocket)
-    games[board_id] = board
-    await websocket.send(
-        DTO(
-            id=board_id,
-            action="START",
-            move=None,
-        ).model_dump_json()
+
+def _on_evict(board: Board):
+    scheduler = schedulers.pop(board.id, None)
+    if scheduler is not None:
+        scheduler.stop()
+
+
+games = GameRegistry.from_env(on_evict=_on_evict)
+
+
+metrics.Observed(
+    "active_games", "Games kept in memory.", "gauge", lambda: [({}, len(games))]
+)
+metrics.Observed(
+    "active_turns",
+    "Agent turns currently running.",
+    "gauge",
+    lambda: [({}, sum(s.busy for s in schedulers.values()))],
+)
+metrics.Observed(
+    "example_prefix_total",
+    "Few-shot example prefix builds and reuses.",
+    "counter",
+    lambda: [({"event": event}, count) for event, count in example_stats.items()],
+)
+if decision_cache is not None:
+    metrics.Observed(
+        "decision_cache_events_total",
+        "Decision cache hits, misses and skipped lookups.",
+        "counter",
+        lambda: [
+            ({"event": event}, count) for event, count in decision_cache.stats.items()
+        ],
     )
-    async for message in websocket:
-        request = DTO.model_validate_json(message)
-        try:
-            if request.action == "SETUP":
-                assert request.id and request.id in games
-                board = games[request.id]
-                board.set_fen(request.fen)
-                board.fen0 = request.fen
-            elif request.action == "MOVE":
-                assert request.id and request.id in games
-                board = games[request.id]
-                if request.move is None:
-                    move = board.random_move()
-                    await websocket.send(
-                        DTO(
-                            id=request.id,
-                            action="MOVE",
-                            move=Move.from_uci(move.uci()),
-                        ).model_dump_json()
-                    )
-                else:
-                    move = board.push_uci(request.move.to_uci())
+
+
+def _get_scheduler(board: Board) -> TurnScheduler:
+    scheduler = schedulers.get(board.id)
+    if scheduler is None:
+        scheduler = schedulers[board.id] = TurnScheduler(
+            board,
+            MODEL_PROVIDER,
+            MODEL_NAME,
+            decision_cache,
+            opening_book,
+            STREAM_RESPONSES,
+            TurnBudget.from_env(),
+            games.checkpoint,
+        )
+    return scheduler
+
+
+async def websocket_handler(request: web.Request) -> web.WebSocketResponse:
+    # the front process attaches extra connections for games owned by this worker
+    attach = request.query.get("attach") == "1"
+    response = await _prepare_websocket(request)
+    websocket = Outbox.from_env(response)
+    connections.add(websocket)
+    board = None
+    if not attach:
+        board_id = new_board_id(shard, shards)
+        board = Board(board_id, websocket)
+        games.add(board)
+        await websocket.send(
+            DTO(
+                id=board_id,
+                action="START",
+                move=None,
+            )
+        )
+    try:
+        async for message in response:
+            if message.type == WSMsgType.TEXT:
+                await _handle_message(websocket, board, message.data)
+    finally:
+        connections.discard(websocket)
+        websocket.close()
+        games.release_connection(websocket)
+    return response
+
+
+async def _prepare_websocket(request: web.Request) -> web.WebSocketResponse:
+    response = web.WebSocketResponse(heartbeat=WS_HEARTBEAT, compress=WS_COMPRESS)
+    await response.prepare(request)
+    return response
+
+
+async def _handle_message(websocket, board: Board | None, message: str):
+    request = DTO.model_validate_json(message)
+    try:
+        if request.action == "SETUP":
+            board = games.get(request.id, websocket)
+            _get_scheduler(board).stop_pondering()
+            await _get_scheduler(board).cancel()
+            board.set_fen(request.fen)
+            board.fen0 = request.fen
+            games.checkpoint(board)
+        elif request.action == "MOVE":
+            board = games.get(request.id, websocket)
+            await _get_scheduler(board).cancel()
+            if request.move is None:
+                move = await _provider_move(board)
                 await websocket.send(
                     DTO(
                         id=request.id,
                         action="MOVE",
                         move=Move.from_uci(move.uci()),
-                    ).model_dump_json()
-                )
-                await llm_move(
-                    board,
-                    ModelProvider.OPENAI,
-                    "gpt-4o-mini",
-                    TemplateType.STATE,
-                )
-            elif request.action == "UNDO":
-                assert request.id and request.id in games
-                board = games[request.id]
-                board.pop()
-            elif request.action == "CHAT":
-                assert request.id and request.id in games
-                board = games[request.id]
-                if not request.text:
-                    board.message_history.clear()
-                    print("Clearing message history")
-                    continue
-                await llm_message(
-                    board,
-                    request.text,
-                    ModelProvider.OPENAI,
-                    "gpt-4o-mini",
+                    )
                 )
-            elif request.action == "MARKER":
-                assert request.id and request.id in games
-                board = games[request.id]
-                square = request.move.source
-                if square in board.markers:
-                    board.markers.remove(square)
-                else:
-                    board.markers.append(square)
-        except Exception as e:
-            print(e)
+            else:
+                move = board.push_uci(request.move.to_uci())
             await websocket.send(
                 DTO(
                     id=request.id,
-                    action="ERROR",
-                    move=None,
-                    fen=board.fen(),
-                ).model_dump_json()
+                    action="MOVE",
+                    move=Move.from_uci(move.uci()),
+                )
+            )
+            await _get_scheduler(board).move()
+        elif request.action == "UNDO":
+            board = games.get(request.id, websocket)
+            plies = request.text or "1"
+            if not plies.isdigit() or int(plies) < 1:
+                print("Invalid number of moves to take back:", plies)
+                await websocket.send(
+                    DTO(id=request.id, action="ERROR", fen=board.fen(), text=plies)
+                )
+                return
+            _get_scheduler(board).stop_pondering()
+            await _get_scheduler(board).cancel()
+            # the markers and chat since the first of the moves are taken back too
+            board.takeback(int(plies))
+            games.checkpoint(board)
+            await websocket.send(DTO(id=request.id, action="UNDO", fen=board.fen()))
+            await websocket.send(DTO(id=request.id, action="MARKER"))
+            for square in board.markers:
+                await websocket.send(
+                    DTO(
+                        id=request.id,
+                        action="MARKER",
+                        move=Move(source=square, target=square),
+                    )
+                )
+        elif request.action == "CHAT":
+            board = games.get(request.id, websocket)
+            if not request.text:
+                await _get_scheduler(board).clear_chat()
+                board.message_history.clear()
+                print("Clearing message history")
+                return
+            _get_scheduler(board).chat(request.text)
+        elif request.action == "MARKER":
+            board = games.get(request.id, websocket)
+            # a speculation may have read the markers, and adopting it would put them back
+            _get_scheduler(board).stop_pondering()
+            square = request.move.source
+            if square in board.markers:
+                board.markers.remove(square)
+            else:
+                board.markers.append(square)
+    except Exception as e:
+        print(e)
+        await websocket.send(
+            DTO(
+                id=request.id,
+                action="ERROR",
+                move=None,
+                fen=board.fen() if board is not None else None,
             )
+        )
 
 
-async def index(request):
-    return web.FileResponse("src/server/index.html")
+async def _provider_move(board: Board):
+    match MOVE_PROVIDER:
+        case "random":
+            return board.random_move()
+        case "engine":
+            return await asyncio.to_thread(board.engine_move, ENGINE_TIME_LIMIT)
+        case _:
+            raise ValueError(f"Unsupported move provider: {MOVE_PROVIDER}")
+
+
+async def metrics_endpoint(request):
+    return web.Response(
+        text=metrics.render(),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+    )
+
+
+async def analyse_endpoint(request):
+    global analysis_executor
+    query = request.query
+    try:
+        parser = PositionParser(
+            query.get("format", "epd"), query.get("all_plies") == "1"
+        )
+        options = {
+            "encoding": PositionEncoding(query.get("encoding", "compact")).value,
+            "engine": float(query.get("engine", "0")),
+            "llm": query.get("llm"),
+        }
+        offset = int(query.get("offset", "0"))
+    except ValueError as e:
+        raise web.HTTPBadRequest(text=str(e))
+    if request.content_type.startswith("multipart/"):
+        reader = await request.multipart()
+        part = await reader.next()
+        lines = read_lines(part.read_chunk)
+    else:
+        lines = read_lines(request.content.readany)
+    if analysis_executor is None:
+        analysis_executor = create_executor(ANALYSIS_WORKERS)
+
+    response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+    await response.prepare(request)
+    results = analyse_stream(
+        lines, parser, options, analysis_executor, offset, ANALYSIS_WINDOW
+    )
+    async for result in results:
+        await response.write((json.dumps(result) + "\n").encode())
+    # a client that lost the connection resumes from the last index it got
+    await response.write(
+        (json.dumps({"done": True, "positions": parser.count}) + "\n").encode()
+    )
+    await response.write_eof()
+    return response
+
+
+async def health(request):
+    return web.json_response(
+        {
+            "shard": shard,
+            "pid": os.getpid(),
+            "games": len(games),
+            "active_turns": sum(s.busy for s in schedulers.values()),
+        }
+    )
+
+
+async def _start_services():
+    metrics.enable_tracing(os.getenv("TRACING", "0") == "1")
+    await preload_examples()
+    games.store = GameStore.from_env()
+    asyncio.create_task(games.run_eviction())
+    asyncio.create_task(metrics.monitor_loop_lag())
+
+
+async def serve_worker(index: int, count: int, port: int):
+    global shard, shards
+    shard, shards = index, count
+    await _start_services()
+
+    app = web.Application()
+    app.router.add_get("/ws", websocket_handler)
+    app.router.add_get("/health", health)
+    app.router.add_get("/metrics", metrics_endpoint)
+    await _serve(app, "localhost", port, _drain)
 
 
 async def main():
-    ws_server = serve(websocket_handler, "localhost", 8765)
+    if WORKERS > 1:
+        await _run_front()
+        return
+    await _start_services()
+
+    app = web.Application()
+    app.router.add_get("/", index_page.handle)
+    app.router.add_get("/ws", websocket_handler)
+    app.router.add_get("/metrics", metrics_endpoint)
+    app.router.add_post("/analyse", analyse_endpoint)
+    await _serve(app, HOST, PORT, _drain)
+
+
+async def _run_front():
+    pool = WorkerPool(WORKERS, WORKER_BASE_PORT)
+    pool.start()
+    health_check = asyncio.create_task(pool.check_health())
+
+    async def proxy(request: web.Request) -> web.WebSocketResponse:
+        client = await _prepare_websocket(request)
+        await pool.handle(client)
+        return client
+
+    async def stop_workers():
+        # the workers drain their own turns and close the upstream connections
+        health_check.cancel()
+        await pool.stop(SHUTDOWN_TIMEOUT)
 
-    gui = web.Application()
-    gui.router.add_get("/", index)
-    gui_runner = web.AppRunner(gui)
-    await gui_runner.setup()
-    site = web.TCPSite(gui_runner, "localhost", 8080)
+    app = web.Application()
+    app.router.add_get("/", index_page.handle)
+    app.router.add_get("/ws", proxy)
+    app.router.add_get("/workers", pool.status_endpoint)
+    app.router.add_get("/metrics", metrics_endpoint)
+    app.router.add_post("/analyse", analyse_endpoint)
+    try:
+        await _serve(app, HOST, PORT, stop_workers)
+    finally:
+        await pool.stop(0)
 
+
+async def _serve(
+    app: web.Application,
+    host: str,
+    port: int,
+    drain: Callable[[], Awaitable],
+):
+    """Runs the app until SIGINT or SIGTERM, then stops taking connections and drains."""
+    runner = web.AppRunner(app, handle_signals=False)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    print(f"Server running on http://{host}:{port}")
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopping.set)
+    await stopping.wait()
+    print("Shutting down")
+    await site.stop()
+    await drain()
+    await runner.cleanup()
+
+
+async def _drain():
+    """Lets running agent turns finish, then closes the connections."""
+    turns = [
+        asyncio.create_task(scheduler.wait())
+        for scheduler in schedulers.values()
+        if scheduler.busy
+    ]
+    if turns:
+        print(f"Waiting for {len(turns)} agent turns")
+        await asyncio.wait(turns, timeout=SHUTDOWN_TIMEOUT)
+    for scheduler in schedulers.values():
+        scheduler.stop()
+    await asyncio.gather(*(websocket.flush() for websocket in connections))
+    # closing ends the handlers, which put the games into the store
     await asyncio.gather(
-        ws_server,
-        site.start(),
+        *(
+            websocket.websocket.close(
+                code=WSCloseCode.GOING_AWAY, message=b"Server shutdown"
+            )
+            for websocket in list(connections)
+        )
     )
-    print("WebSocket server running on ws://localhost:8765")
-    print("HTTP server running on http://localhost:8080")
-
-    await asyncio.Event().wait()
@@ -0,0 +1,121 @@
+import asyncio
+import os
+import time
+from collections import deque
+
+from aiohttp import WSCloseCode
+
+from .. import metrics
+from ..api import DTO
+
+# progress notices a slow client can miss without losing any game state
+TRANSIENT_ACTIONS = ("TOOL", "QUEUE")
+
+
+class Outbox:
+    """
+    The outbound messages of one connection. send() only queues the message and
+    a writer task delivers it, so a slow client never holds up an agent turn.
+    Chat fragments and marker toggles still waiting are merged, DTOs are
+    serialized once right before they are written.
+    """
+
+    def __init__(self, websocket, high_water: int = 64, max_size: int = 1024):
+        self.websocket = websocket
+        self.high_water = high_water
+        self.max_size = max_size
+        self.closed = False
+        self._queue: deque[DTO | str] = deque()
+        self._task: asyncio.Task | None = None
+
+    @staticmethod
+    def from_env(websocket) -> "Outbox":
+        return Outbox(
+            websocket,
+            high_water=int(os.getenv("OUTBOX_HIGH_WATER", "64")),
+            max_size=int(os.getenv("OUTBOX_MAX_SIZE", "1024")),
+        )
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    async def send(self, message: DTO | str):
+        self.post(message)
+
+    def post(self, message: DTO | str):
+        if self.closed:
+            return
+        if isinstance(message, DTO) and self._coalesce(message):
+            metrics.outbox_coalesced.inc(action=message.action)
+            return
+        if len(self._queue) >= self.high_water:
+            if isinstance(message, DTO) and message.action in TRANSIENT_ACTIONS:
+                metrics.outbox_dropped.inc(reason="high_water")
+                return
+            if len(self._queue) >= self.max_size:
+                # the client stopped reading, drop it rather than buffer forever
+                print("Closing a connection that does not keep up")
+                metrics.outbox_dropped.inc(len(self._queue) + 1, reason="overflow")
+                self.closed = True
+                self._queue.clear()
+                if self._task is not None:
+                    self._task.cancel()
+                asyncio.create_task(
+                    self.websocket.close(
+                        code=WSCloseCode.TRY_AGAIN_LATER, message=b"Client too slow"
+                    )
+                )
+                return
+        self._queue.append(message)
+        if self._task is None:
+            self._task = asyncio.create_task(self._write())
+
+    async def flush(self):
+        """Waits until everything queued so far has been written."""
+        while self._task is not None:
+            await asyncio.wait([self._task])
+
+    def close(self):
+        self.closed = True
+        self._queue.clear()
+        if self._task is not None:
+            self._task.cancel()
+
+    def _coalesce(self, dto: DTO) -> bool:
+        if dto.action == "CHAT_PARTIAL":
+            last = self._queue[-1] if self._queue else None
+            if (
+                isinstance(last, DTO)
+                and last.action == "CHAT_PARTIAL"
+                and last.id == dto.id
+            ):
+                self._queue[-1] = last.model_copy(update={"text": last.text + dto.text})
+                return True
+        elif dto.action == "MARKER" and dto.move is not None:
+            # two toggles of the same square cancel out, unless the markers were cleared in between
+            for i in range(len(self._queue) - 1, -1, -1):
+                queued = self._queue[i]
+                if not isinstance(queued, DTO) or queued.action != "MARKER":
+                    continue
+                if queued.id != dto.id or queued.move is None:
+                    break
+                if queued.move.source == dto.move.source:
+                    del self._queue[i]
+                    return True
+        return False
+
+    async def _write(self):
+        try:
+            while self._queue:
+                message = self._queue.popleft()
+                if isinstance(message, DTO):
+                    message = message.model_dump_json()
+                with metrics.span("websocket_send"):
+                    start = time.perf_counter()
+                    await self.websocket.send_str(message)
+                    metrics.send_seconds.observe(time.perf_counter() - start)
+        except ConnectionResetError:
+            self.closed = True
+            self._queue.clear()
+        finally:
+            self._task = None
@@ -0,0 +1,159 @@
+import asyncio
+import os
+from collections.abc import Awaitable, Callable
+from functools import partial
+
+import chess
+
+from .. import metrics
+from ..api import DTO
+from ..chess import Board
+from ..chess.engine import Searcher
+from ..llm.budget import TurnBudget
+from ..llm.service import TurnReport
+from .outbox import TRANSIENT_ACTIONS
+
+# speculative turns running in this process, across all games
+_running: set[asyncio.Task] = set()
+
+metrics.Observed(
+    "ponder_active",
+    "Speculative agent turns running.",
+    "gauge",
+    lambda: [({}, len(_running))],
+)
+
+
+class RecordingWebsocket:
+    """Keeps what a speculative turn sends until it is known to be needed."""
+
+    def __init__(self):
+        self.messages: list[DTO | str] = []
+
+    async def send(self, message: DTO | str):
+        self.messages.append(message)
+
+
+class Speculation:
+    __slots__ = ("board", "budget", "task")
+
+    def __init__(self, board: Board, budget: TurnBudget, task: asyncio.Task):
+        self.board = board
+        self.budget = budget
+        self.task = task
+
+
+class Ponderer:
+    """
+    While the human thinks, runs the agent on copies of the board after each of
+    their likeliest replies. If the reply is one of them, the agent's turn only
+    replays what the speculation did.
+    """
+
+    def __init__(
+        self,
+        board: Board,
+        run: Callable[[Board, TurnBudget], Awaitable[TurnReport]],
+        width: int = 2,
+        rank_time: float = 0.2,
+        max_active: int = 8,
+        max_tokens: int | None = None,
+    ):
+        self.board = board
+        self.run = run
+        self.width = width
+        self.rank_time = rank_time
+        self.max_active = max_active
+        self.max_tokens = max_tokens
+        self._ply: int | None = None
+        self._task: asyncio.Task | None = None
+        self._speculations: dict[chess.Move, Speculation] = {}
+
+    @staticmethod
+    def from_env(
+        board: Board, run: Callable[[Board, TurnBudget], Awaitable[TurnReport]]
+    ) -> "Ponderer | None":
+        width = int(os.getenv("PONDER_WIDTH", "0"))
+        if width <= 0:
+            return None
+        max_tokens = int(os.getenv("PONDER_MAX_TOKENS", "0"))
+        return Ponderer(
+            board,
+            run,
+            width=width,
+            rank_time=float(os.getenv("PONDER_RANK_TIME", "0.2")),
+            max_active=int(os.getenv("PONDER_MAX_ACTIVE", "8")),
+            max_tokens=max_tokens if max_tokens > 0 else None,
+        )
+
+    def start(self):
+        """Starts pondering on the current position, where the human is to move."""
+        self.stop()
+        if self.board.is_game_over():
+            return
+        self._ply = len(self.board.move_stack)
+        self._task = asyncio.create_task(self._ponder(self.board.copy()))
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for speculation in self._speculations.values():
+            self._discard(speculation)
+        self._speculations.clear()
+
+    def take(self) -> Callable[[], Awaitable[TurnReport]] | None:
+        """The prepared turn for the move the human just made, if it was predicted."""
+        pondered = bool(self._speculations) or self._task is not None
+        speculation = None
+        if self._ply is not None and len(self.board.move_stack) == self._ply + 1:
+            speculation = self._speculations.pop(self.board.peek(), None)
+        self.stop()
+        if speculation is None:
+            if pondered:
+                metrics.ponder_events.inc(event="miss")
+            return None
+        metrics.ponder_events.inc(event="hit")
+        return partial(self._adopt, speculation)
+
+    async def _ponder(self, board: Board):
+        # the engine's best replies stand in for the likeliest ones
+        searcher = Searcher(time_limit=self.rank_time)
+        candidates = await asyncio.to_thread(searcher.search, board, self.width)
+        for move, _ in candidates:
+            if len(_running) >= self.max_active:
+                metrics.ponder_events.inc(event="skipped")
+                break
+            speculation = board.copy()
+            speculation.websocket = RecordingWebsocket()
+            speculation.push(move)
+            budget = TurnBudget.from_env()
+            if self.max_tokens is not None:
+                budget.max_tokens = min(
+                    budget.max_tokens or self.max_tokens, self.max_tokens
+                )
+            task = asyncio.create_task(self.run(speculation, budget))
+            _running.add(task)
+            task.add_done_callback(_running.discard)
+            self._speculations[move] = Speculation(speculation, budget, task)
+            metrics.ponder_events.inc(event="started")
+
+    async def _adopt(self, speculation: Speculation) -> TurnReport:
+        # a prediction that is still thinking keeps its head start
+        report = await speculation.task
+        board = self.board
+        for move in speculation.board.move_stack[len(board.move_stack) :]:
+            board.push(move)
+        board.markers[:] = speculation.board.markers
+        board.message_history[:] = speculation.board.message_history
+        for message in speculation.board.websocket.messages:
+            if isinstance(message, DTO) and message.action in TRANSIENT_ACTIONS:
+                continue
+            await board.websocket.send(message)
+        metrics.ponder_tokens.inc(speculation.budget.tokens, outcome="used")
+        return report
+
+    def _discard(self, speculation: Speculation):
+        speculation.task.cancel()
+        metrics.ponder_tokens.inc(speculation.budget.tokens, outcome="wasted")
+        metrics.ponder_events.inc(event="discarded")
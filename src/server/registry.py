@@ -0,0 +1,198 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from langchain_core.messages import messages_from_dict, messages_to_dict
+
+from ..chess import Board
+
+
+def shard_of(board_id: str, shards: int) -> int:
+    """The worker that owns a board id, stable across processes and restarts."""
+    return zlib.crc32(board_id.encode()) % shards
+
+
+def new_board_id(shard: int = 0, shards: int = 1) -> str:
+    """A fresh board id that routes to the given shard."""
+    while True:
+        board_id = str(uuid.uuid4())
+        if shard_of(board_id, shards) == shard:
+            return board_id
+
+
+class GameStore:
+    """
+    SQLite store for games that are no longer kept in memory. The database is
+    only used from a writer thread, so saves do not block the event loop and a
+    load sees every save queued before it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db: sqlite3.Connection | None = None
+        self._writer = ThreadPoolExecutor(1, thread_name_prefix="game-store")
+
+    @staticmethod
+    def from_env() -> "GameStore | None":
+        path = os.getenv("GAMES_STORE_PATH", "games.db")
+        return GameStore(path) if path else None
+
+    def save(self, board: Board) -> Future:
+        # the board keeps changing on the loop, so the state is taken here
+        state = {
+            "fen0": board.fen0,
+            "moves": [move.uci() for move in board.move_stack],
+            "markers": board.markers,
+            "message_history": messages_to_dict(board.message_history),
+        }
+        return self._writer.submit(self._write, board.id, json.dumps(state))
+
+    def load(self, board_id: str, websocket) -> Board | None:
+        row = self._writer.submit(self._read, board_id).result()
+        if row is None:
+            return None
+        state = json.loads(row[0])
+        board = Board(board_id, websocket)
+        board.markers = state["markers"]
+        board.message_history = messages_from_dict(state["message_history"])
+        board.set_fen(state["fen0"])
+        board.fen0 = state["fen0"]
+        # the markers and chat before each move are not stored, a takeback keeps the current ones
+        for move in state["moves"]:
+            board.push_uci(move)
+        return board
+
+    def close(self):
+        self._writer.submit(self._close).result()
+        self._writer.shutdown()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(self.path)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS games (id TEXT PRIMARY KEY, updated REAL, state TEXT)"
+            )
+        return self._db
+
+    def _write(self, board_id: str, state: str):
+        db = self._connect()
+        db.execute(
+            "INSERT OR REPLACE INTO games VALUES (?, ?, ?)",
+            (board_id, time.time(), state),
+        )
+        db.commit()
+
+    def _read(self, board_id: str) -> tuple | None:
+        return (
+            self._connect()
+            .execute("SELECT state FROM games WHERE id = ?", (board_id,))
+            .fetchone()
+        )
+
+    def _close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+class GameRegistry:
+    """Games kept in memory, bounded by an idle timeout and a maximum count."""
+
+    def __init__(
+        self,
+        max_games: int = 1000,
+        idle_ttl: float = 1800,
+        store: GameStore | None = None,
+        on_evict: Callable[[Board], None] | None = None,
+    ):
+        self.max_games = max_games
+        self.idle_ttl = idle_ttl
+        self.store = store
+        self.on_evict = on_evict
+        self._games: OrderedDict[str, tuple[float, Board]] = OrderedDict()
+        # the games of each connection, so a disconnect does not scan them all
+        self._connections: dict[object, set[str]] = {}
+        self._owners: dict[str, object] = {}
+
+    @staticmethod
+    def from_env(on_evict: Callable[[Board], None] | None = None) -> "GameRegistry":
+        # the store is opened by the server on start, importing it has no side effects
+        return GameRegistry(
+            max_games=int(os.getenv("GAMES_MAX_RESIDENT", "1000")),
+            idle_ttl=float(os.getenv("GAMES_IDLE_TTL", "1800")),
+            on_evict=on_evict,
+        )
+
+    def __len__(self) -> int:
+        return len(self._games)
+
+    def add(self, board: Board):
+        self._games[board.id] = (time.monotonic(), board)
+        self._games.move_to_end(board.id)
+        owner = self._owners.get(board.id)
+        if owner is not board.websocket:
+            if owner is not None:
+                self._connections[owner].discard(board.id)
+            self._owners[board.id] = board.websocket
+            self._connections.setdefault(board.websocket, set()).add(board.id)
+        while len(self._games) > self.max_games:
+            _, (_, evicted) = self._games.popitem(last=False)
+            self._evict(evicted)
+
+    def get(self, board_id: str | None, websocket) -> Board:
+        """Returns the game with the given id, restoring it from the store if needed."""
+        if board_id is None:
+            raise KeyError("Missing board id")
+        if board_id in self._games:
+            _, board = self._games[board_id]
+        else:
+            board = self.store.load(board_id, websocket) if self.store else None
+            if board is None:
+                raise KeyError(f"Unknown board id: {board_id}")
+            print("Restored game", board_id)
+        board.websocket = websocket
+        self.add(board)
+        return board
+
+    def release_connection(self, websocket):
+        for board_id in list(self._connections.get(websocket, ())):
+            _, board = self._games.pop(board_id)
+            self._evict(board)
+
+    def checkpoint(self, board: Board):
+        """Saves a game that stays in memory, so it survives a crash of the process."""
+        if self.store is not None:
+            self.store.save(board)
+
+    def evict_idle(self):
+        now = time.monotonic()
+        while self._games:
+            board_id, (last_used, board) = next(iter(self._games.items()))
+            if now - last_used < self.idle_ttl:
+                break
+            del self._games[board_id]
+            self._evict(board)
+
+    async def run_eviction(self, interval: float = 60):
+        while True:
+            await asyncio.sleep(interval)
+            self.evict_idle()
+
+    def _evict(self, board: Board):
+        owner = self._owners.pop(board.id, None)
+        connection = self._connections.get(owner)
+        if connection is not None:
+            connection.discard(board.id)
+            if not connection:
+                del self._connections[owner]
+        if self.on_evict is not None:
+            self.on_evict(board)
+        if self.store is not None:
+            self.store.save(board)
@@ -0,0 +1,34 @@
+import gzip
+import hashlib
+
+from aiohttp import web
+
+
+class StaticPage:
+    """A page read once and served from memory, gzipped for clients that accept it."""
+
+    def __init__(self, path: str, content_type: str = "text/html"):
+        with open(path, "rb") as f:
+            self.body = f.read()
+        self.gzipped = gzip.compress(self.body, mtime=0)
+        self.content_type = content_type
+        self.etag = hashlib.sha256(self.body).hexdigest()[:16]
+
+    async def handle(self, request: web.Request) -> web.Response:
+        gzipped = "gzip" in request.headers.get("Accept-Encoding", "")
+        etag = f'"{self.etag}-gzip"' if gzipped else f'"{self.etag}"'
+        # browsers revalidate on every load and get a 304 until the page changes
+        headers = {
+            "ETag": etag,
+            "Cache-Control": "no-cache",
+            "Vary": "Accept-Encoding",
+        }
+        if etag in request.headers.get("If-None-Match", ""):
+            return web.Response(status=304, headers=headers)
+        if gzipped:
+            headers["Content-Encoding"] = "gzip"
+        return web.Response(
+            body=self.gzipped if gzipped else self.body,
+            content_type=self.content_type,
+            headers=headers,
+        )
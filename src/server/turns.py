@@ -0,0 +1,150 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+from functools import partial
+
+from ..api import DTO
+from ..chess import Board
+from ..chess.book import OpeningBook
+from ..llm.budget import TurnBudget
+from ..llm.cache import DecisionCache
+from ..llm.prompts import TemplateType
+from ..llm.scheduler import Priority
+from ..llm.service import ModelProvider, TurnReport, llm_message, llm_move
+from .ponder import Ponderer
+
+
+class TurnScheduler:
+    """Runs the agent turns of a game as background tasks, one at a time."""
+
+    def __init__(
+        self,
+        board: Board,
+        model_provider: ModelProvider,
+        model_name: str,
+        decision_cache: DecisionCache | None = None,
+        opening_book: OpeningBook | None = None,
+        stream: bool = False,
+        budget: TurnBudget | None = None,
+        checkpoint: Callable[[Board], None] | None = None,
+    ):
+        self.board = board
+        self.model_provider = model_provider
+        self.model_name = model_name
+        self.decision_cache = decision_cache
+        self.opening_book = opening_book
+        self.stream = stream
+        self.budget = budget
+        self.checkpoint = checkpoint
+        self.chat_queue: list[str] = []
+        self._task: asyncio.Task | None = None
+        self.ponderer = Ponderer.from_env(board, self._speculate)
+
+    @property
+    def busy(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def cancel(self):
+        if not self.busy:
+            return
+        self._task.cancel()
+        await asyncio.wait([self._task])
+
+    async def wait(self):
+        if self.busy:
+            await asyncio.wait([self._task])
+
+    def stop(self):
+        self.stop_pondering()
+        if self.busy:
+            self._task.cancel()
+
+    def stop_pondering(self):
+        if self.ponderer is not None:
+            self.ponderer.stop()
+
+    async def move(self):
+        await self.cancel()
+        prepared = self.ponderer.take() if self.ponderer is not None else None
+        self._start(
+            prepared
+            or partial(
+                llm_move,
+                self.board,
+                self.model_provider,
+                self.model_name,
+                TemplateType.STATE,
+                self.decision_cache,
+                self.opening_book,
+                self.stream,
+                self.budget,
+            ),
+            ponder=self.ponderer is not None,
+        )
+
+    def chat(self, text: str):
+        # a speculation would bring back the history without this message
+        self.stop_pondering()
+        self.chat_queue.append(text)
+        if not self.busy:
+            self._start(None)
+
+    async def clear_chat(self):
+        self.stop_pondering()
+        self.chat_queue.clear()
+        await self.cancel()
+
+    async def _speculate(self, board: Board, budget: TurnBudget) -> TurnReport:
+        return await llm_move(
+            board,
+            self.model_provider,
+            self.model_name,
+            TemplateType.STATE,
+            self.decision_cache,
+            self.opening_book,
+            False,
+            budget,
+            Priority.PONDER,
+        )
+
+    def _start(self, turn: Callable[[], Awaitable] | None, ponder: bool = False):
+        self._task = asyncio.create_task(self._run(turn, ponder))
+
+    async def _run(self, turn: Callable[[], Awaitable] | None, ponder: bool = False):
+        await self._send_status("thinking")
+        try:
+            if turn is not None:
+                await turn()
+            # chat messages received during a turn are answered together
+            while self.chat_queue:
+                text = "\n".join(self.chat_queue)
+                self.chat_queue.clear()
+                await llm_message(
+                    self.board,
+                    text,
+                    self.model_provider,
+                    self.model_name,
+                    self.stream,
+                    self.budget,
+                )
+            if ponder:
+                self.ponderer.start()
+        except asyncio.CancelledError:
+            await self._send_status("cancelled")
+            raise
+        except Exception as e:
+            print(e)
+            await self.board.websocket.send(
+                DTO(
+                    id=self.board.id,
+                    action="ERROR",
+                    fen=self.board.fen(),
+                )
+            )
+        if self.checkpoint is not None:
+            self.checkpoint(self.board)
+        await self._send_status("idle")
+
+    async def _send_status(self, status: str):
+        await self.board.websocket.send(
+            DTO(id=self.board.id, action="STATUS", text=status)
+        )
@@ -0,0 +1,181 @@
+import asyncio
+import json
+import multiprocessing
+import os
+
+import aiohttp
+from aiohttp import web
+
+from .. import metrics
+from .registry import shard_of
+
+HEALTH_TIMEOUT = aiohttp.ClientTimeout(total=2)
+
+
+def _run_worker(index: int, count: int, port: int):
+    from . import serve_worker
+
+    asyncio.run(serve_worker(index, count, port))
+
+
+class Worker:
+    """A server process that owns one shard of the games."""
+
+    def __init__(self, index: int, count: int, port: int):
+        self.index = index
+        self.count = count
+        self.port = port
+        self.process: multiprocessing.Process | None = None
+        self.connections = 0
+        self.healthy = False
+        self.health: dict = {}
+
+    @property
+    def url(self) -> str:
+        return f"ws://localhost:{self.port}/ws"
+
+    def start(self):
+        context = multiprocessing.get_context("spawn")
+        self.process = context.Process(
+            target=_run_worker,
+            args=(self.index, self.count, self.port),
+            daemon=True,
+        )
+        self.process.start()
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def status(self) -> dict:
+        return {
+            "index": self.index,
+            "pid": self.process.pid if self.process else None,
+            "port": self.port,
+            "alive": self.is_alive(),
+            "healthy": self.healthy,
+            "connections": self.connections,
+            **self.health,
+        }
+
+
+class WorkerPool:
+    """Runs the worker processes and routes client connections to them by board id."""
+
+    def __init__(self, count: int, base_port: int):
+        self.workers = [Worker(i, count, base_port + i) for i in range(count)]
+        self.session: aiohttp.ClientSession | None = None
+        metrics.Observed(
+            "worker_up",
+            "Whether a worker process answers its health check.",
+            "gauge",
+            lambda: [({"worker": str(w.index)}, int(w.healthy)) for w in self.workers],
+        )
+        metrics.Observed(
+            "worker_connections",
+            "Client connections routed to a worker.",
+            "gauge",
+            lambda: [({"worker": str(w.index)}, w.connections) for w in self.workers],
+        )
+        metrics.Observed(
+            "worker_games",
+            "Games kept in memory by a worker.",
+            "gauge",
+            lambda: [
+                ({"worker": str(w.index)}, w.health.get("games", 0))
+                for w in self.workers
+            ],
+        )
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+        print(f"Started {len(self.workers)} workers")
+
+    async def stop(self, timeout: float):
+        """Terminates the workers and waits for them to finish their turns."""
+        for worker in self.workers:
+            if worker.is_alive():
+                worker.process.terminate()
+        for worker in self.workers:
+            if worker.process is not None:
+                await asyncio.to_thread(worker.process.join, timeout)
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def owner(self, board_id: str) -> Worker:
+        return self.workers[shard_of(board_id, len(self.workers))]
+
+    def pick(self) -> Worker:
+        """The least loaded healthy worker for a new game."""
+        candidates = [w for w in self.workers if w.healthy] or self.workers
+        return min(candidates, key=lambda w: (w.connections, w.health.get("games", 0)))
+
+    async def check_health(self, interval: float = 5):
+        async with aiohttp.ClientSession(timeout=HEALTH_TIMEOUT) as session:
+            while True:
+                await asyncio.gather(*(self._check(session, w) for w in self.workers))
+                await asyncio.sleep(interval)
+
+    async def _check(self, session: aiohttp.ClientSession, worker: Worker):
+        if not worker.is_alive():
+            # its games were checkpointed after every turn and get restored by the new process
+            print(f"Worker {worker.index} is down, restarting")
+            worker.healthy = False
+            worker.start()
+            return
+        try:
+            async with session.get(
+                f"http://localhost:{worker.port}/health"
+            ) as response:
+                worker.health = await response.json()
+                worker.healthy = response.status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            worker.healthy = False
+
+    async def handle(self, client: web.WebSocketResponse):
+        """Proxies a client connection, opening a connection per worker it needs."""
+        if self.session is None:
+            self.session = aiohttp.ClientSession()
+        primary = self.pick()
+        primary.connections += 1
+        upstreams = {}
+        pumps = []
+
+        async def pump(upstream: aiohttp.ClientWebSocketResponse):
+            try:
+                async for message in upstream:
+                    if message.type == aiohttp.WSMsgType.TEXT:
+                        await client.send_str(message.data)
+            finally:
+                await client.close()
+
+        async def get_upstream(worker: Worker) -> aiohttp.ClientWebSocketResponse:
+            if worker.index not in upstreams:
+                url = worker.url if worker is primary else f"{worker.url}?attach=1"
+                upstreams[worker.index] = upstream = await self.session.ws_connect(url)
+                pumps.append(asyncio.create_task(pump(upstream)))
+            return upstreams[worker.index]
+
+        try:
+            await get_upstream(primary)
+            async for message in client:
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    continue
+                board_id = json.loads(message.data).get("id")
+                worker = self.owner(board_id) if board_id else primary
+                await (await get_upstream(worker)).send_str(message.data)
+        finally:
+            primary.connections -= 1
+            for task in pumps:
+                task.cancel()
+            for upstream in upstreams.values():
+                await upstream.close()
+
+    async def status_endpoint(self, request):
+        return web.json_response(
+            {
+                "front_pid": os.getpid(),
+                "workers": [worker.status() for worker in self.workers],
+            }
+        )
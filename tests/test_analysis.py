@@ -0,0 +1,86 @@
+import sys
+import threading
+
+import pytest
+
+import chess
+from src.chess import Board
+
+FENS = [
+    chess.STARTING_FEN,
+    "r1bqkbnr/pppp1ppp/2n5/1B2p3/4P3/5N2/PPPP1PPP/RNBQK2R b KQkq - 3 3",
+    "4k3/4r3/8/8/1b6/8/3NN3/4K3 w - - 0 1",
+    "4k3/8/8/8/8/8/8/4K2R w K - 0 1",
+]
+
+
+def board_at(fen: str) -> Board:
+    board = Board("x")
+    board.set_fen(fen)
+    return board
+
+
+@pytest.mark.parametrize("fen", FENS)
+def test_moves_from_matches_legal_moves(fen):
+    board = board_at(fen)
+    analysis = board.analysis()
+    for square in chess.SQUARES:
+        expected = [m for m in board.legal_moves if m.from_square == square]
+        assert analysis.moves_from(square) == expected
+
+
+@pytest.mark.parametrize("fen", FENS)
+def test_attackers_match_python_chess(fen):
+    board = board_at(fen)
+    analysis = board.analysis()
+    for color in chess.COLORS:
+        for square in chess.SQUARES:
+            assert analysis.attackers(color, square) == board.attackers(color, square)
+
+
+@pytest.mark.parametrize("first", chess.COLORS)
+def test_pins_are_cached_per_color(first):
+    board = board_at("4k3/4r3/8/8/1b6/8/3NN3/4K3 w - - 0 1")
+    analysis = board.analysis()
+    for color in [first, not first]:
+        for square in [chess.D2, chess.E2]:
+            assert analysis.is_pinned(color, square) == board.is_pinned(color, square)
+    assert analysis.is_pinned(chess.WHITE, chess.E2)
+    assert not analysis.is_pinned(chess.BLACK, chess.E2)
+
+
+def test_analysis_follows_the_position():
+    board = board_at(chess.STARTING_FEN)
+    before = board.analysis()
+    assert board.analysis() is before
+    board.push_san("e4")
+    assert board.analysis() is not before
+    assert board.analysis().moves_from(chess.E4) == []
+
+
+def test_moves_from_read_from_threads():
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        for fen in FENS * 10:
+            board = board_at(fen)
+            expected = {
+                square: [m for m in board.legal_moves if m.from_square == square]
+                for square in chess.SQUARES
+            }
+            mismatches = []
+
+            def read():
+                analysis = board.analysis()
+                for square in chess.SQUARES:
+                    if analysis.moves_from(square) != expected[square]:
+                        mismatches.append(square)
+
+            threads = [threading.Thread(target=read) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert mismatches == []
+    finally:
+        sys.setswitchinterval(interval)
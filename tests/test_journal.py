@@ -0,0 +1,140 @@
+import random
+import sys
+import threading
+
+import pytest
+
+import chess
+import chess.polyglot
+from src.chess import Board
+
+
+def play(board: Board, reference: chess.Board, plies: int, seed: int = 0):
+    rng = random.Random(seed)
+    for _ in range(plies):
+        if board.is_game_over():
+            break
+        move = rng.choice(sorted(board.legal_moves, key=chess.Move.uci))
+        board.push(move)
+        reference.push(move)
+
+
+def assert_matches(board: Board, reference: chess.Board):
+    root = reference.root()
+    assert board.san_history() == root.variation_san(reference.move_stack)
+    assert board.zobrist_hash() == chess.polyglot.zobrist_hash(reference)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_journal_matches_variation_san_and_zobrist(seed):
+    board, reference = Board("x"), chess.Board()
+    for _ in range(6):
+        play(board, reference, 10, seed)
+        # checks in between fill the journal while it is warm
+        assert_matches(board, reference)
+    for _ in range(5):
+        board.pop()
+        reference.pop()
+    assert_matches(board, reference)
+
+
+def test_journal_from_a_custom_position():
+    fen = "r3k2r/8/8/8/8/8/8/R3K2R b KQkq - 0 20"
+    board, reference = Board("x"), chess.Board(fen)
+    board.set_fen(fen)
+    play(board, reference, 8)
+    assert board.san_history().startswith("20...")
+    assert_matches(board, reference)
+
+
+def test_cold_journal_after_replay():
+    board, reference = Board("x"), chess.Board()
+    play(board, reference, 30, seed=3)
+    # nothing read the journal while the moves were pushed
+    assert_matches(board, reference)
+
+
+def test_repetition_checks_keep_the_journal():
+    board, reference = Board("x"), chess.Board()
+    for san in ["Nf3", "Nf6", "Ng1", "Ng8"] * 2:
+        board.push_san(san)
+        reference.push_san(san)
+        board.san_history()
+        # python-chess pops and pushes the moves back to look for repetitions
+        board.is_repetition(2)
+        board.can_claim_threefold_repetition()
+    assert board.is_repetition(3)
+    assert_matches(board, reference)
+
+
+def test_takeback_restores_markers_and_chat():
+    board = Board("x")
+    board.push_san("e4")
+    board.markers.append("e4")
+    board.message_history.append("first")
+    board.push_san("e5")
+    board.markers.append("e5")
+    board.message_history.append("second")
+    board.push_san("Nf3")
+
+    assert len(board.takeback(2)) == 2
+    assert board.markers == ["e4"]
+    assert board.message_history == ["first"]
+    assert board.san_history() == "1. e4"
+    assert board.zobrist_hash() == chess.polyglot.zobrist_hash(
+        chess.Board("rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1")
+    )
+
+
+@pytest.mark.parametrize("plies", [-1, 0])
+def test_takeback_of_nothing_changes_nothing(plies):
+    board = Board("x")
+    board.markers.append("a1")
+    board.push_san("e4")
+    board.markers.append("b2")
+    assert board.takeback(plies) == []
+    assert board.markers == ["a1", "b2"]
+    assert len(board.move_stack) == 1
+
+
+def test_takeback_is_clamped_to_the_moves_made():
+    board = Board("x")
+    board.push_san("e4")
+    assert len(board.takeback(5)) == 1
+    assert board.san_history() == ""
+
+
+def test_copy_keeps_the_journal():
+    board, reference = Board("x"), chess.Board()
+    play(board, reference, 12, seed=1)
+    board.markers.append("d4")
+    copy = board.copy()
+    assert_matches(copy, reference)
+    copy.takeback(1)
+    assert copy.markers == []
+    assert board.markers == ["d4"]
+
+
+def test_cold_journal_read_from_threads():
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        for seed in range(20):
+            board, reference = Board("x"), chess.Board()
+            play(board, reference, 40, seed)
+            expected = chess.Board().variation_san(reference.move_stack)
+            results = []
+
+            def read():
+                results.append((board.san_history(), board.zobrist_hash()))
+
+            threads = [threading.Thread(target=read) for _ in range(6)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert results == [
+                (expected, chess.polyglot.zobrist_hash(reference))
+            ] * len(threads)
+    finally:
+        sys.setswitchinterval(interval)
@@ -0,0 +1,93 @@
+import asyncio
+import json
+
+from aiohttp import WSCloseCode
+
+from src.api import DTO, Move
+from src.server.outbox import Outbox
+
+
+class FakeWebsocket:
+    def __init__(self):
+        self.sent: list[dict] = []
+        self.close_code: int | None = None
+
+    async def send_str(self, message: str):
+        self.sent.append(json.loads(message))
+
+    async def close(self, code: int, message: bytes = b""):
+        self.close_code = code
+
+
+def marker(square: str | None) -> DTO:
+    move = Move(source=square, target=square) if square else None
+    return DTO(id="x", action="MARKER", move=move)
+
+
+def deliver(outbox: Outbox, messages: list[DTO]) -> list[dict]:
+    async def run():
+        # post() only queues, so everything is queued before the writer runs
+        for message in messages:
+            outbox.post(message)
+        await outbox.flush()
+
+    asyncio.run(run())
+    return outbox.websocket.sent
+
+
+def test_chat_fragments_are_merged():
+    sent = deliver(
+        Outbox(FakeWebsocket()),
+        [
+            DTO(id="x", action="CHAT_PARTIAL", text="Hel"),
+            DTO(id="x", action="CHAT_PARTIAL", text="lo"),
+            DTO(id="x", action="CHAT", text="Hello"),
+            DTO(id="x", action="CHAT_PARTIAL", text="Bye"),
+        ],
+    )
+    assert [(m["action"], m["text"]) for m in sent] == [
+        ("CHAT_PARTIAL", "Hello"),
+        ("CHAT", "Hello"),
+        ("CHAT_PARTIAL", "Bye"),
+    ]
+
+
+def test_marker_toggles_of_a_square_cancel_out():
+    sent = deliver(Outbox(FakeWebsocket()), [marker("e4"), marker("d4"), marker("e4")])
+    assert [m["move"]["source"] for m in sent] == ["d4"]
+
+
+def test_marker_toggles_do_not_cancel_across_a_clear():
+    sent = deliver(Outbox(FakeWebsocket()), [marker("e4"), marker(None), marker("e4")])
+    assert [m["move"] and m["move"]["source"] for m in sent] == ["e4", None, "e4"]
+
+
+def test_progress_notices_are_dropped_above_the_high_water_mark():
+    outbox = Outbox(FakeWebsocket(), high_water=2, max_size=10)
+    sent = deliver(
+        outbox,
+        [
+            DTO(id="x", action="MOVE", move=Move(source="e2", target="e4")),
+            DTO(id="x", action="STATUS", text="thinking"),
+            DTO(id="x", action="TOOL", text="get_position"),
+            DTO(id="x", action="QUEUE", text="1"),
+            DTO(id="x", action="CHAT", text="Done"),
+        ],
+    )
+    assert [m["action"] for m in sent] == ["MOVE", "STATUS", "CHAT"]
+    assert outbox.websocket.close_code is None
+
+
+def test_a_client_that_stops_reading_is_closed():
+    outbox = Outbox(FakeWebsocket(), high_water=1, max_size=3)
+
+    async def run():
+        for i in range(4):
+            outbox.post(DTO(id="x", action="CHAT", text=str(i)))
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert outbox.closed
+    assert len(outbox) == 0
+    assert outbox.websocket.close_code == WSCloseCode.TRY_AGAIN_LATER
+    assert outbox.websocket.sent == []
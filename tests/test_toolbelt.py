@@ -0,0 +1,85 @@
+import asyncio
+
+from langchain_core.tools import tool
+
+from src.chess import Board
+from src.llm.tools import Toolbelt
+
+
+def instrumented_toolbelt(events: list[tuple[str, str]]) -> Toolbelt:
+    toolbelt = Toolbelt(Board("x"))
+
+    def fake(name: str):
+        async def run() -> str:
+            events.append(("start", name))
+            await asyncio.sleep(0.02)
+            events.append(("end", name))
+            return name
+
+        run.__name__ = name
+        run.__doc__ = name
+        return tool(run)
+
+    for name in [
+        "get_position",
+        "get_moves",
+        "get_square_info",
+        "send_message",
+        "make_move",
+    ]:
+        toolbelt.tools[name] = fake(name)
+    return toolbelt
+
+
+def call(name: str, index: int) -> dict:
+    return {"name": name, "args": {}, "id": f"call_{index}", "type": "tool_call"}
+
+
+def run(names: list[str]) -> tuple[list, list[tuple[str, str]]]:
+    events = []
+    toolbelt = instrumented_toolbelt(events)
+    calls = [call(name, i) for i, name in enumerate(names)]
+    responses = asyncio.run(toolbelt.run(calls))
+    return responses, events
+
+
+def test_reads_run_concurrently():
+    _, events = run(["get_position", "get_moves", "get_square_info"])
+    starts = [i for i, (kind, _) in enumerate(events) if kind == "start"]
+    assert starts == [0, 1, 2]
+
+
+def test_write_waits_for_the_reads_before_it():
+    _, events = run(["get_position", "get_moves", "make_move"])
+    assert events.index(("start", "make_move")) > events.index(("end", "get_position"))
+    assert events.index(("start", "make_move")) > events.index(("end", "get_moves"))
+
+
+def test_writes_run_one_after_another():
+    _, events = run(["send_message", "make_move"])
+    assert events == [
+        ("start", "send_message"),
+        ("end", "send_message"),
+        ("start", "make_move"),
+        ("end", "make_move"),
+    ]
+
+
+def test_reads_wait_for_the_write_before_them():
+    _, events = run(["make_move", "get_position", "get_moves"])
+    write_end = events.index(("end", "make_move"))
+    assert events.index(("start", "get_position")) > write_end
+    assert events.index(("start", "get_moves")) > write_end
+    # the reads after the write still run together
+    assert events.index(("start", "get_moves")) < events.index(("end", "get_position"))
+
+
+def test_responses_keep_the_order_of_the_calls():
+    responses, _ = run(["make_move", "get_moves", "get_position", "get_square_info"])
+    assert [r.tool_call_id for r in responses] == [f"call_{i}" for i in range(4)]
+    assert [r.content for r in responses] == [
+        "make_move",
+        "get_moves",
+        "get_position",
+        "get_square_info",
+    ]